@@ -0,0 +1,12 @@
+#!/bin/sh
+
+# Builds the library with link time and profile guided optimization. The
+# profile comes from running tools/pgotrain.py through the Python binding.
+
+set -e
+
+meson setup --buildtype=release -Db_lto=true -Db_pgo=generate capypgo
+ninja -C capypgo
+CAPYPDF_SO_OVERRIDE=capypgo/src python3 tools/pgotrain.py capypgo/pgotrain.pdf "$@"
+meson configure -Db_pgo=use capypgo
+ninja -C capypgo
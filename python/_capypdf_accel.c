@@ -0,0 +1,204 @@
+// SPDX-License-Identifier: Apache-2.0
+// Copyright 2023-2024 Jussi Pakkanen
+
+// Optional fast paths for the hottest DrawContext methods. The ctypes
+// binding in capypdf.py works without this module, but every ctypes call
+// packs its arguments into a tuple and converts them one by one. These
+// functions use METH_FASTCALL and call the C API directly.
+
+#define Py_LIMITED_API 0x030A0000
+#define PY_SSIZE_T_CLEAN
+#include <Python.h>
+
+#include <capypdf.h>
+
+static PyObject *error_type = NULL;
+static PyObject *fontid_type = NULL;
+static PyObject *argument_error_type = NULL;
+
+static PyObject *get_error_type(void) { return error_type ? error_type : PyExc_RuntimeError; }
+
+static int check_nargs(const char *name, Py_ssize_t nargs, Py_ssize_t expected) {
+    if(nargs != expected) {
+        PyErr_Format(
+            PyExc_TypeError, "%s() takes exactly %zd arguments (%zd given)", name, expected, nargs);
+        return -1;
+    }
+    return 0;
+}
+
+static CapyPDF_DrawContext *get_dc(PyObject *handle) {
+    void *ptr = PyLong_AsVoidPtr(handle);
+    if(!ptr) {
+        if(!PyErr_Occurred()) {
+            PyErr_SetString(PyExc_ValueError, "Draw context handle is null.");
+        }
+        return NULL;
+    }
+    return (CapyPDF_DrawContext *)ptr;
+}
+
+// Converts args[first..first+num) with the same error as a ctypes c_double
+// argument, so callers see one exception type with or without this module.
+static int get_doubles(PyObject *const *args, Py_ssize_t first, Py_ssize_t num, double *out) {
+    for(Py_ssize_t i = 0; i < num; ++i) {
+        out[i] = PyFloat_AsDouble(args[first + i]);
+        if(out[i] == -1.0 && PyErr_Occurred()) {
+            if(argument_error_type) {
+                PyErr_Clear();
+                // ctypes numbers C arguments from 1, the handle is the first one.
+                PyErr_Format(
+                    argument_error_type, "argument %zd: TypeError: wrong type", first + i + 1);
+            }
+            return -1;
+        }
+    }
+    return 0;
+}
+
+static PyObject *handle_rc(CapyPDF_EC rc) {
+    if(rc != 0) {
+        PyErr_SetString(get_error_type(), capy_error_message(rc));
+        return NULL;
+    }
+    Py_RETURN_NONE;
+}
+
+static PyObject *accel_setup(PyObject *self, PyObject *const *args, Py_ssize_t nargs) {
+    if(check_nargs("setup", nargs, 3) < 0) {
+        return NULL;
+    }
+    Py_XDECREF(error_type);
+    Py_XDECREF(fontid_type);
+    Py_XDECREF(argument_error_type);
+    error_type = Py_NewRef(args[0]);
+    fontid_type = Py_NewRef(args[1]);
+    argument_error_type = Py_NewRef(args[2]);
+    Py_RETURN_NONE;
+}
+
+static PyObject *library_address(PyObject *self, PyObject *const *args, Py_ssize_t nargs) {
+    if(check_nargs("library_address", nargs, 0) < 0) {
+        return NULL;
+    }
+    // Lets capypdf.py check that it and this module use the same copy of
+    // the library.
+    return PyLong_FromVoidPtr((void *)capy_error_message);
+}
+
+static PyObject *dc_cmd_re(PyObject *self, PyObject *const *args, Py_ssize_t nargs) {
+    double coords[4];
+    CapyPDF_DrawContext *dc;
+    if(check_nargs("dc_cmd_re", nargs, 5) < 0 || !(dc = get_dc(args[0])) ||
+       get_doubles(args, 1, 4, coords) < 0) {
+        return NULL;
+    }
+    return handle_rc(capy_dc_cmd_re(dc, coords[0], coords[1], coords[2], coords[3]));
+}
+
+static PyObject *dc_cmd_rg(PyObject *self, PyObject *const *args, Py_ssize_t nargs) {
+    double rgb[3];
+    CapyPDF_DrawContext *dc;
+    if(check_nargs("dc_cmd_rg", nargs, 4) < 0 || !(dc = get_dc(args[0])) ||
+       get_doubles(args, 1, 3, rgb) < 0) {
+        return NULL;
+    }
+    return handle_rc(capy_dc_cmd_rg(dc, rgb[0], rgb[1], rgb[2]));
+}
+
+static PyObject *dc_cmd_RG(PyObject *self, PyObject *const *args, Py_ssize_t nargs) {
+    double rgb[3];
+    CapyPDF_DrawContext *dc;
+    if(check_nargs("dc_cmd_RG", nargs, 4) < 0 || !(dc = get_dc(args[0])) ||
+       get_doubles(args, 1, 3, rgb) < 0) {
+        return NULL;
+    }
+    return handle_rc(capy_dc_cmd_RG(dc, rgb[0], rgb[1], rgb[2]));
+}
+
+static PyObject *dc_cmd_f(PyObject *self, PyObject *const *args, Py_ssize_t nargs) {
+    CapyPDF_DrawContext *dc;
+    if(check_nargs("dc_cmd_f", nargs, 1) < 0 || !(dc = get_dc(args[0]))) {
+        return NULL;
+    }
+    return handle_rc(capy_dc_cmd_f(dc));
+}
+
+static PyObject *dc_render_text(PyObject *self, PyObject *const *args, Py_ssize_t nargs) {
+    CapyPDF_DrawContext *dc;
+    CapyPDF_FontId fid;
+    PyObject *idobj;
+    PyObject *text_copy = NULL;
+    PyObject *result;
+    const char *text;
+    double params[3];
+    if(check_nargs("dc_render_text", nargs, 6) < 0 || !(dc = get_dc(args[0]))) {
+        return NULL;
+    }
+    if(!PyUnicode_Check(args[1]) && !PyBytes_Check(args[1]) && !PyByteArray_Check(args[1]) &&
+       !PyMemoryView_Check(args[1])) {
+        PyErr_SetString(get_error_type(), "Text to render is not a string or UTF-8 bytes.");
+        return NULL;
+    }
+    if(!fontid_type || PyObject_IsInstance(args[2], fontid_type) != 1) {
+        if(!PyErr_Occurred()) {
+            PyErr_SetString(get_error_type(), "Font id argument is not a font id object.");
+        }
+        return NULL;
+    }
+    if(get_doubles(args, 3, 3, params) < 0) {
+        return NULL;
+    }
+    idobj = PyObject_GetAttrString(args[2], "id");
+    if(!idobj) {
+        return NULL;
+    }
+    fid.id = (int32_t)PyLong_AsLong(idobj);
+    Py_DECREF(idobj);
+    if(PyErr_Occurred()) {
+        return NULL;
+    }
+    if(PyUnicode_Check(args[1])) {
+        text = PyUnicode_AsUTF8AndSize(args[1], NULL);
+    } else if(PyBytes_Check(args[1])) {
+        text = PyBytes_AsString(args[1]);
+    } else if(PyByteArray_Check(args[1])) {
+        text = PyByteArray_AsString(args[1]);
+    } else {
+        // Memoryviews need not be null terminated, so copy them.
+        text_copy = PyObject_Bytes(args[1]);
+        text = text_copy ? PyBytes_AsString(text_copy) : NULL;
+    }
+    if(!text) {
+        Py_XDECREF(text_copy);
+        return NULL;
+    }
+    result = handle_rc(capy_dc_render_text(dc, text, fid, params[0], params[1], params[2]));
+    Py_XDECREF(text_copy);
+    return result;
+}
+
+static PyMethodDef accel_methods[] = {
+    {"setup", (PyCFunction)(void (*)(void))accel_setup, METH_FASTCALL, NULL},
+    {"library_address", (PyCFunction)(void (*)(void))library_address, METH_FASTCALL, NULL},
+    {"dc_cmd_re", (PyCFunction)(void (*)(void))dc_cmd_re, METH_FASTCALL, NULL},
+    {"dc_cmd_rg", (PyCFunction)(void (*)(void))dc_cmd_rg, METH_FASTCALL, NULL},
+    {"dc_cmd_RG", (PyCFunction)(void (*)(void))dc_cmd_RG, METH_FASTCALL, NULL},
+    {"dc_cmd_f", (PyCFunction)(void (*)(void))dc_cmd_f, METH_FASTCALL, NULL},
+    {"dc_render_text", (PyCFunction)(void (*)(void))dc_render_text, METH_FASTCALL, NULL},
+    {NULL, NULL, 0, NULL},
+};
+
+static struct PyModuleDef accel_module = {
+    PyModuleDef_HEAD_INIT,
+    "_capypdf_accel",
+    NULL,
+    -1,
+    accel_methods,
+    NULL,
+    NULL,
+    NULL,
+    NULL,
+};
+
+PyMODINIT_FUNC PyInit__capypdf_accel(void) { return PyModule_Create(&accel_module); }
@@ -5,7 +5,10 @@
 import ctypes
 import os, sys
 import math
-from enum import Enum, IntFlag, auto
+import functools
+import weakref
+from array import array
+from enum import Enum, IntEnum, IntFlag, auto
 
 class LineCapStyle(Enum):
     Butt = 0
@@ -17,6 +20,41 @@ class LineJoinStyle(Enum):
     Round = 1
     Bevel = 2
 
+class DrawOperation(IntEnum):
+    b = 0
+    B = 1
+    bstar = 2
+    Bstar = 3
+    c = 4
+    cm = 5
+    f = 6
+    fstar = 7
+    G = 8
+    g = 9
+    h = 10
+    k = 11
+    K = 12
+    l = 13
+    m = 14
+    n = 15
+    q = 16
+    Q = 17
+    re = 18
+    RG = 19
+    rg = 20
+    s = 21
+    S = 22
+    v = 23
+    w = 24
+    W = 25
+    Wstar = 26
+    y = 27
+
+# Plain ints for CommandBuffer, reading an enum member is much slower.
+for _op in DrawOperation:
+    globals()['_OP_' + _op.name] = _op.value
+del _op
+
 class BlendMode(Enum):
     Normal = 0
     Multiply = 1
@@ -188,6 +226,11 @@ class CapyPDFException(Exception):
 ec_type = ctypes.c_int32
 enum_type = ctypes.c_int32
 
+# Used when creating every object, so skip the module attribute lookups.
+_c_void_p = ctypes.c_void_p
+_pointer = ctypes.pointer
+_byref = ctypes.byref
+
 class AnnotationId(ctypes.Structure):
     _fields_ = [('id', ctypes.c_int32)]
 
@@ -277,6 +320,7 @@ cfunc_types = (
 ('capy_generator_add_structure_item', [ctypes.c_void_p, enum_type, ctypes.c_void_p, ctypes.c_void_p, ctypes.c_void_p]),
 ('capy_generator_add_custom_structure_item', [ctypes.c_void_p, RoleId, ctypes.c_void_p, ctypes.c_void_p, ctypes.c_void_p]),
 ('capy_generator_write', [ctypes.c_void_p]),
+('capy_generator_create_annotation', [ctypes.c_void_p, ctypes.c_void_p, ctypes.c_void_p]),
 ('capy_generator_add_graphics_state', [ctypes.c_void_p, ctypes.c_void_p, ctypes.c_void_p]),
 ('capy_generator_add_optional_content_group', [ctypes.c_void_p, ctypes.c_void_p, ctypes.c_void_p]),
 ('capy_generator_add_outline', [ctypes.c_void_p, ctypes.c_void_p, ctypes.c_void_p]),
@@ -291,6 +335,7 @@ cfunc_types = (
 ('capy_dc_cmd_B', [ctypes.c_void_p]),
 ('capy_dc_cmd_bstar', [ctypes.c_void_p]),
 ('capy_dc_cmd_Bstar', [ctypes.c_void_p]),
+('capy_dc_cmd_BDC_builtin', [ctypes.c_void_p, StructureItemId]),
 ('capy_dc_cmd_BDC_ocg', [ctypes.c_void_p, OptionalContentGroupId]),
 ('capy_dc_cmd_BMC', [ctypes.c_void_p, ctypes.c_char_p]),
 ('capy_dc_cmd_c', [ctypes.c_void_p,
@@ -319,6 +364,7 @@ cfunc_types = (
 ('capy_dc_cmd_RG', [ctypes.c_void_p, ctypes.c_double, ctypes.c_double, ctypes.c_double]),
 ('capy_dc_cmd_rg', [ctypes.c_void_p, ctypes.c_double, ctypes.c_double, ctypes.c_double]),
 ('capy_dc_cmd_re', [ctypes.c_void_p, ctypes.c_double, ctypes.c_double, ctypes.c_double, ctypes.c_double]),
+('capy_dc_cmd_re_batch', [ctypes.c_void_p, ctypes.POINTER(ctypes.c_double), ctypes.c_int32]),
 ('capy_dc_cmd_ri', [ctypes.c_void_p, enum_type]),
 ('capy_dc_cmd_s', [ctypes.c_void_p]),
 ('capy_dc_cmd_S', [ctypes.c_void_p]),
@@ -328,13 +374,16 @@ cfunc_types = (
 ('capy_dc_cmd_W', [ctypes.c_void_p]),
 ('capy_dc_cmd_Wstar', [ctypes.c_void_p]),
 ('capy_dc_cmd_y', [ctypes.c_void_p, ctypes.c_double, ctypes.c_double, ctypes.c_double, ctypes.c_double]),
+('capy_dc_replay', [ctypes.c_void_p, ctypes.c_void_p, ctypes.c_int32, ctypes.c_void_p, ctypes.c_int32]),
 ('capy_dc_set_custom_page_properties', [ctypes.c_void_p, ctypes.c_void_p]),
+('capy_dc_set_page_transition', [ctypes.c_void_p, ctypes.c_void_p]),
 ('capy_dc_draw_image',
     [ctypes.c_void_p, ImageId]),
 ('capy_dc_render_text',
     [ctypes.c_void_p, ctypes.c_char_p, FontId, ctypes.c_double, ctypes.c_double, ctypes.c_double]),
 ('capy_dc_render_text_obj',
     [ctypes.c_void_p, ctypes.c_void_p]),
+('capy_dc_set_stroke', [ctypes.c_void_p, ctypes.c_void_p]),
 ('capy_dc_set_nonstroke', [ctypes.c_void_p, ctypes.c_void_p]),
 ('capy_dc_text_new', [ctypes.c_void_p, ctypes.c_void_p]),
 ('capy_dc_annotate', [ctypes.c_void_p, AnnotationId]),
@@ -512,18 +561,13 @@ if libfile is None:
 if libfile is None:
     raise CapyPDFException('Could not locate shared library.')
 
-for funcname, argtypes in cfunc_types:
-    funcobj = getattr(libfile, funcname)
-    if argtypes is not None:
-        funcobj.argtypes = argtypes
-    funcobj.restype = ec_type
-
 # This is the only function in the public API not to return an errorcode.
-libfile.capy_error_message.argtypes = [ctypes.c_int32]
-libfile.capy_error_message.restype = ctypes.c_char_p
+_capy_error_message = libfile.capy_error_message
+_capy_error_message.argtypes = [ctypes.c_int32]
+_capy_error_message.restype = ctypes.c_char_p
 
 def get_error_message(errorcode):
-    return libfile.capy_error_message(errorcode).decode('UTF-8', errors='ignore')
+    return _capy_error_message(errorcode).decode('UTF-8', errors='ignore')
 
 def raise_with_error(errorcode):
     raise CapyPDFException(get_error_message(errorcode))
@@ -532,6 +576,32 @@ def check_error(errorcode):
     if errorcode != 0:
         raise_with_error(errorcode)
 
+def _setup_functions():
+    module_globals = globals()
+    for funcname, argtypes in cfunc_types:
+        funcobj = libfile[funcname]
+        funcobj.argtypes = argtypes
+        funcobj.restype = ec_type
+        # Module level aliases avoid a CDLL attribute lookup on every call.
+        module_globals['_' + funcname] = funcobj
+
+_setup_functions()
+
+def _load_accel():
+    try:
+        import _capypdf_accel
+    except ImportError:
+        return None
+    # The extension uses whatever libcapypdf the dynamic linker finds, which
+    # need not be the one loaded above (e.g. with CAPYPDF_SO_OVERRIDE).
+    # Objects created by one copy must never be passed to the other.
+    if _capypdf_accel.library_address() != ctypes.cast(_capy_error_message, _c_void_p).value:
+        return None
+    _capypdf_accel.setup(CapyPDFException, FontId, ctypes.ArgumentError)
+    return _capypdf_accel
+
+_capypdf_accel = _load_accel()
+
 def to_bytepath(filename):
     if isinstance(filename, bytes):
         return filename
@@ -540,6 +610,10 @@ def to_bytepath(filename):
     else:
         return str(filename).encode('UTF-8')
 
+def _register_destructor(obj, destroy_func):
+    # The handle is captured by value so the finalizer does not keep obj alive.
+    weakref.finalize(obj, destroy_func, obj._as_parameter_)
+
 def to_array(ctype, array):
     if not isinstance(array, (list, tuple)):
         raise CapyPDFException('Array value argument must be an list or tuple.')
@@ -547,210 +621,254 @@ def to_array(ctype, array):
 
 class Options:
     def __init__(self):
-        opt = ctypes.c_void_p()
-        check_error(libfile.capy_options_new(ctypes.pointer(opt)))
+        opt = _c_void_p()
+        check_error(_capy_options_new(_byref(opt)))
         self._as_parameter_ = opt
-
-    def __del__(self):
-        check_error(libfile.capy_options_destroy(self))
+        _register_destructor(self, _capy_options_destroy)
 
     def set_colorspace(self, cs):
         if not isinstance(cs, DeviceColorspace):
             raise CapyPDFException('Argument not a device colorspace object.')
-        check_error(libfile.capy_options_set_colorspace(self, cs.value))
+        check_error(_capy_options_set_colorspace(self, cs.value))
 
     def set_title(self, title):
         if not isinstance(title, str):
             raise CapyPDFException('Title must be an Unicode string.')
-        check_error(libfile.capy_options_set_title(self, title.encode('UTF-8')))
+        check_error(_capy_options_set_title(self, title.encode('UTF-8')))
 
     def set_author(self, author):
         if not isinstance(author, str):
             raise CapyPDFException('Author must be an Unicode string.')
-        check_error(libfile.capy_options_set_author(self, author.encode('UTF-8')))
+        check_error(_capy_options_set_author(self, author.encode('UTF-8')))
 
     def set_creator(self, creator):
         if not isinstance(creator, str):
             raise CapyPDFException('Creator must be an Unicode string.')
-        check_error(libfile.capy_options_set_creator(self, creator.encode('UTF-8')))
+        check_error(_capy_options_set_creator(self, creator.encode('UTF-8')))
 
     def set_language(self, lang):
         if not isinstance(lang, str):
             raise CapyPDFException('Creator must be an Unicode string.')
-        check_error(libfile.capy_options_set_language(self, lang.encode('ASCII')))
+        check_error(_capy_options_set_language(self, lang.encode('ASCII')))
 
     def set_device_profile(self, colorspace, path):
-        check_error(libfile.capy_options_set_device_profile(self, colorspace.value, to_bytepath(path)))
+        check_error(_capy_options_set_device_profile(self, colorspace.value, to_bytepath(path)))
 
     def set_output_intent(self, identifier):
-        check_error(libfile.capy_options_set_output_intent(self, identifier.encode('utf-8')))
+        check_error(_capy_options_set_output_intent(self, identifier.encode('utf-8')))
 
     def set_pdfx(self, xtype):
         if not isinstance(xtype, PdfXType):
             raise CapyPDFException('Argument must be an PDF/X type.')
-        check_error(libfile.capy_options_set_pdfx(self, xtype.value))
+        check_error(_capy_options_set_pdfx(self, xtype.value))
 
     def set_default_page_properties(self, props):
         if not isinstance(props, PageProperties):
             raise CapyPDFException('Argument is not a PageProperties object.')
-        check_error(libfile.capy_options_set_default_page_properties(self, props))
+        check_error(_capy_options_set_default_page_properties(self, props))
 
     def set_tagged(self, is_tagged):
         tagint = 1 if is_tagged else 0
-        check_error(libfile.capy_options_set_tagged(self, tagint))
+        check_error(_capy_options_set_tagged(self, tagint))
 
 
 class PageProperties:
     def __init__(self):
-        opt = ctypes.c_void_p()
-        check_error(libfile.capy_page_properties_new(ctypes.pointer(opt)))
+        opt = _c_void_p()
+        check_error(_capy_page_properties_new(_byref(opt)))
         self._as_parameter_ = opt
-
-    def __del__(self):
-        check_error(libfile.capy_page_properties_destroy(self))
+        _register_destructor(self, _capy_page_properties_destroy)
 
     def set_pagebox(self, boxtype, x1, y1, x2, y2):
-        check_error(libfile.capy_page_properties_set_pagebox(self, boxtype.value, x1, y1, x2, y2))
+        check_error(_capy_page_properties_set_pagebox(self, boxtype.value, x1, y1, x2, y2))
 
 
 class DrawContextBase:
 
     def __init__(self, generator):
         self.generator = generator
-
-    def __del__(self):
-        check_error(libfile.capy_dc_destroy(self))
+        self._command_buffers = []
 
     def cmd_b(self):
-        check_error(libfile.capy_dc_cmd_b(self))
+        check_error(_capy_dc_cmd_b(self))
 
     def cmd_B(self):
-        check_error(libfile.capy_dc_cmd_B(self))
+        check_error(_capy_dc_cmd_B(self))
 
     def cmd_bstar(self):
-        check_error(libfile.capy_dc_cmd_bstar(self))
+        check_error(_capy_dc_cmd_bstar(self))
 
     def cmd_Bstar(self):
-        check_error(libfile.capy_dc_cmd_Bstar(self))
+        check_error(_capy_dc_cmd_Bstar(self))
 
     def cmd_BDC(self, ocg):
         if not isinstance(ocg, OptionalContentGroupId):
             raise CapyPDFException('Argument must be an optional content group ID.')
-        check_error(libfile.capy_dc_cmd_BDC_ocg(self, ocg))
+        check_error(_capy_dc_cmd_BDC_ocg(self, ocg))
         # FIXME, return a context manager.
 
     def cmd_BDC_builtin(self, structid):
         if not isinstance(structid, StructureItemId):
             raise CapyPDFException('Argument must be a structure item ID.')
-        check_error(libfile.capy_dc_cmd_BDC_builtin(self, structid))
+        check_error(_capy_dc_cmd_BDC_builtin(self, structid))
         return MarkedContextManager(self)
 
     def cmd_BMC(self, tag):
-        check_error(libfile.capy_dc_cmd_BMC(self, tag.encode('UTF-8')))
+        check_error(_capy_dc_cmd_BMC(self, tag.encode('UTF-8')))
         return MarkedContextManager(self)
 
     def cmd_c(self, x1, y1, x2, y2, x3, y3):
-        check_error(libfile.capy_dc_cmd_c(self, x1, y1, x2, y2, x3, y3))
+        check_error(_capy_dc_cmd_c(self, x1, y1, x2, y2, x3, y3))
 
     def cmd_cm(self, m1, m2, m3, m4, m5, m6):
-        check_error(libfile.capy_dc_cmd_cm(self, m1, m2, m3, m4, m5, m6))
+        check_error(_capy_dc_cmd_cm(self, m1, m2, m3, m4, m5, m6))
 
     def cmd_d(self, array, phase):
-        check_error(libfile.capy_dc_cmd_d(self, *to_array(ctypes.c_double, array), phase))
+        check_error(_capy_dc_cmd_d(self, *to_array(ctypes.c_double, array), phase))
 
     def cmd_EMC(self):
-        check_error(libfile.capy_dc_cmd_EMC(self))
+        check_error(_capy_dc_cmd_EMC(self))
 
     def cmd_f(self):
-        check_error(libfile.capy_dc_cmd_f(self))
+        check_error(_capy_dc_cmd_f(self))
 
     def cmd_fstar(self):
-        check_error(libfile.capy_dc_cmd_fstar(self))
+        check_error(_capy_dc_cmd_fstar(self))
 
     def cmd_G(self, gray):
-        check_error(libfile.capy_dc_cmd_G(self, gray))
+        check_error(_capy_dc_cmd_G(self, gray))
 
     def cmd_g(self, gray):
-        check_error(libfile.capy_dc_cmd_g(self, gray))
+        check_error(_capy_dc_cmd_g(self, gray))
 
     def cmd_gs(self, gsid):
         if not isinstance(gsid, GraphicsStateId):
             raise CapyPDFException('Argument must be a graphics state id.')
-        check_error(libfile.capy_dc_cmd_gs(self, gsid))
+        check_error(_capy_dc_cmd_gs(self, gsid))
 
     def cmd_h(self):
-        check_error(libfile.capy_dc_cmd_h(self))
+        check_error(_capy_dc_cmd_h(self))
 
     def cmd_i(self, flatness):
-        check_error(libfile.capy_dc_cmd_i(self, flatness))
+        check_error(_capy_dc_cmd_i(self, flatness))
 
     def cmd_J(self, cap_style):
-        check_error(libfile.capy_dc_cmd_J(self, cap_style.value))
+        check_error(_capy_dc_cmd_J(self, cap_style.value))
 
     def cmd_j(self, join_style):
-        check_error(libfile.capy_dc_cmd_j(self, join_style.value))
+        check_error(_capy_dc_cmd_j(self, join_style.value))
 
     def cmd_k(self, c, m, y, k):
-        check_error(libfile.capy_dc_cmd_k(self, c, m, y, k))
+        check_error(_capy_dc_cmd_k(self, c, m, y, k))
 
     def cmd_K(self, c, m, y, k):
-        check_error(libfile.capy_dc_cmd_K(self, c, m, y, k))
+        check_error(_capy_dc_cmd_K(self, c, m, y, k))
 
     def cmd_l(self, x, y):
-        check_error(libfile.capy_dc_cmd_l(self, x, y))
+        check_error(_capy_dc_cmd_l(self, x, y))
 
     def cmd_m(self, x, y):
-        check_error(libfile.capy_dc_cmd_m(self, x, y))
+        check_error(_capy_dc_cmd_m(self, x, y))
 
     def cmd_M(self, miterlimit):
-        check_error(libfile.capy_dc_cmd_M(self, miterlimit))
+        check_error(_capy_dc_cmd_M(self, miterlimit))
 
     def cmd_n(self):
-        check_error(libfile.capy_dc_cmd_n(self))
+        check_error(_capy_dc_cmd_n(self))
 
     def cmd_q(self):
-        check_error(libfile.capy_dc_cmd_q(self))
+        check_error(_capy_dc_cmd_q(self))
 
     def cmd_Q(self):
-        check_error(libfile.capy_dc_cmd_Q(self))
+        check_error(_capy_dc_cmd_Q(self))
 
     def cmd_re(self, x, y, w, h):
-        check_error(libfile.capy_dc_cmd_re(self, x, y, w, h))
+        check_error(_capy_dc_cmd_re(self, x, y, w, h))
+
+    def draw_rects(self, rects):
+        # Buffers of doubles, like an (N, 4) float64 NumPy array, are passed
+        # to the C library as is.
+        try:
+            view = memoryview(rects)
+        except TypeError:
+            view = None
+        if view is not None and view.format == 'd' and view.c_contiguous:
+            if not (view.ndim == 1 and len(view) % 4 == 0 or view.ndim == 2 and view.shape[1] == 4):
+                raise CapyPDFException('Rectangles must have exactly 4 values.')
+            self._draw_rect_view(view, view.nbytes // (4 * view.itemsize))
+            return
+        coords = []
+        for rect in rects:
+            if len(rect) != 4:
+                raise CapyPDFException('Rectangles must have exactly 4 values.')
+            coords.extend(rect)
+        arr, num_coords = to_array(ctypes.c_double, coords)
+        check_error(_capy_dc_cmd_re_batch(self, arr, num_coords // 4))
+
+    def cmd_rects_from_buffer(self, buf, num_rects):
+        # Draws the first num_rects x, y, w, h quadruplets of a buffer of
+        # doubles, such as array('d'), without converting them one by one.
+        view = memoryview(buf)
+        if view.format != 'd' or not view.c_contiguous:
+            raise CapyPDFException('Buffer must be a contiguous array of doubles.')
+        if view.nbytes < num_rects * 4 * view.itemsize:
+            raise CapyPDFException('Buffer is too small for the given number of rectangles.')
+        self._draw_rect_view(view, num_rects)
+
+    def _draw_rect_view(self, view, num_rects):
+        if num_rects <= 0:
+            # Let the C library report the error.
+            check_error(_capy_dc_cmd_re_batch(self, None, num_rects))
+            return
+        arraytype = ctypes.c_double * (num_rects * 4)
+        if view.readonly:
+            # from_buffer needs write access, so read-only data is copied once.
+            arr = arraytype.from_buffer_copy(view)
+        else:
+            arr = arraytype.from_buffer(view)
+        check_error(_capy_dc_cmd_re_batch(self, arr, num_rects))
 
     def cmd_RG(self, r, g, b):
-        check_error(libfile.capy_dc_cmd_RG(self, r, g, b))
+        check_error(_capy_dc_cmd_RG(self, r, g, b))
 
     def cmd_rg(self, r, g, b):
-        check_error(libfile.capy_dc_cmd_rg(self, r, g, b))
+        check_error(_capy_dc_cmd_rg(self, r, g, b))
 
     def cmd_ri(self, ri):
         if not isinstance(ri, RenderingIntent):
             raise CapyPDFException('Argument must be a RenderingIntent.')
-        check_error(libfile.capy_dc_cmd_ri(self, ri.value))
+        check_error(_capy_dc_cmd_ri(self, ri.value))
 
     def cmd_s(self):
-        check_error(libfile.capy_dc_cmd_s(self))
+        check_error(_capy_dc_cmd_s(self))
 
     def cmd_S(self):
-        check_error(libfile.capy_dc_cmd_S(self))
+        check_error(_capy_dc_cmd_S(self))
 
     def cmd_sh(self, shid):
-        check_error(libfile.capy_dc_cmd_sh(self, shid))
+        check_error(_capy_dc_cmd_sh(self, shid))
 
     def cmd_v(self, x2, y2, x3, y3):
-        check_error(libfile.capy_dc_cmd_v(self, x2, y2, x3, y3))
+        check_error(_capy_dc_cmd_v(self, x2, y2, x3, y3))
 
     def cmd_w(self, line_width):
-        check_error(libfile.capy_dc_cmd_w(self, line_width))
+        check_error(_capy_dc_cmd_w(self, line_width))
 
     def cmd_W(self):
-        check_error(libfile.capy_dc_cmd_W(self))
+        check_error(_capy_dc_cmd_W(self))
 
     def cmd_Wstar(self):
-        check_error(libfile.capy_dc_cmd_Wstar(self))
+        check_error(_capy_dc_cmd_Wstar(self))
 
     def cmd_y(self, x1, y1, x3, y3):
-        check_error(libfile.capy_dc_cmd_y(self, x1, y1, x3, y3))
+        check_error(_capy_dc_cmd_y(self, x1, y1, x3, y3))
+
+    def command_buffer(self):
+        return CommandBuffer(self)
+
+    def _flush_command_buffers(self):
+        for buf in self._command_buffers:
+            buf.flush()
 
     def set_stroke(self, color):
         if isinstance(color, PatternId):
@@ -759,7 +877,7 @@ class DrawContextBase:
             color = pattern_color
         if not isinstance(color, Color):
             raise CapyPDFException('Argument must be a Color object.')
-        check_error(libfile.capy_dc_set_stroke(self, color))
+        check_error(_capy_dc_set_stroke(self, color))
 
     def set_nonstroke(self, color):
         if isinstance(color, PatternId):
@@ -768,28 +886,36 @@ class DrawContextBase:
             color = pattern_color
         if not isinstance(color, Color):
             raise CapyPDFException('Argument must be a Color object.')
-        check_error(libfile.capy_dc_set_nonstroke(self, color))
+        check_error(_capy_dc_set_nonstroke(self, color))
 
     def render_text(self, text, fid, point_size, x, y):
-        if not isinstance(text, str):
-            raise CapyPDFException('Text to render is not a string.')
-        if not isinstance(fid, FontId):
+        if isinstance(text, str):
+            text_bytes = text.encode('UTF-8')
+        elif isinstance(text, bytes):
+            # Already UTF-8, the C side validates it.
+            text_bytes = text
+        elif isinstance(text, (bytearray, memoryview)):
+            text_bytes = bytes(text)
+        else:
+            raise CapyPDFException('Text to render is not a string or UTF-8 bytes.')
+        # Font ids can only come from load_font. Outside of debug mode a bad
+        # value is still rejected, with a ctypes.ArgumentError from argtypes.
+        if __debug__ and not isinstance(fid, FontId):
             raise CapyPDFException('Font id argument is not a font id object.')
-        text_bytes = text.encode('UTF-8')
-        check_error(libfile.capy_dc_render_text(self, text_bytes, fid, point_size, x, y))
+        check_error(_capy_dc_render_text(self, text_bytes, fid, point_size, x, y))
 
     def render_text_obj(self, tobj):
-        check_error(libfile.capy_dc_render_text_obj(self, tobj))
+        check_error(_capy_dc_render_text_obj(self, tobj))
 
     def draw_image(self, iid):
         if not isinstance(iid, ImageId):
             raise CapyPDFException('Image id argument is not an image id object.')
-        check_error(libfile.capy_dc_draw_image(self, iid))
+        check_error(_capy_dc_draw_image(self, iid))
 
     def set_page_transition(self, tr):
         if not isinstance(tr, Transition):
             raise CapyPDFException('Argument is not a transition object.')
-        check_error(libfile.capy_dc_set_page_transition(self, tr))
+        check_error(_capy_dc_set_page_transition(self, tr))
 
     def text_new(self):
         return Text(self)
@@ -803,13 +929,32 @@ class DrawContextBase:
     def rotate(self, angle):
         self.cmd_cm(math.cos(angle), math.sin(angle), -math.sin(angle), math.cos(angle), 0.0, 0.0)
 
+    if _capypdf_accel is not None:
+        # The most common drawing calls go straight into the extension
+        # module instead of through ctypes.
+        def cmd_re(self, x, y, w, h):
+            _capypdf_accel.dc_cmd_re(self._as_parameter_.value, x, y, w, h)
+
+        def cmd_rg(self, r, g, b):
+            _capypdf_accel.dc_cmd_rg(self._as_parameter_.value, r, g, b)
+
+        def cmd_RG(self, r, g, b):
+            _capypdf_accel.dc_cmd_RG(self._as_parameter_.value, r, g, b)
+
+        def cmd_f(self):
+            _capypdf_accel.dc_cmd_f(self._as_parameter_.value)
+
+        def render_text(self, text, fid, point_size, x, y):
+            _capypdf_accel.dc_render_text(self._as_parameter_.value, text, fid, point_size, x, y)
+
 class DrawContext(DrawContextBase):
 
     def __init__(self, generator):
         super().__init__(generator)
-        dcptr = ctypes.c_void_p()
-        check_error(libfile.capy_page_draw_context_new(generator, ctypes.pointer(dcptr)))
+        dcptr = _c_void_p()
+        check_error(_capy_page_draw_context_new(generator, _byref(dcptr)))
         self._as_parameter_ = dcptr
+        _register_destructor(self, _capy_dc_destroy)
 
     def __enter__(self):
         return self
@@ -828,34 +973,36 @@ class DrawContext(DrawContextBase):
         arr = arraytype(*tuple(ocgs))
         if transition is not None and not isinstance(transition, Transition):
             raise CapyPDFException('Transition argument must be a transition object.')
-        check_error(libfile.capy_dc_add_simple_navigation(self,
-                                                          ctypes.pointer(arr),
-                                                          len(ocgs),
-                                                          transition))
+        check_error(_capy_dc_add_simple_navigation(self,
+                                                   _pointer(arr),
+                                                   len(ocgs),
+                                                   transition))
 
     def set_custom_page_properties(self, props):
         if not isinstance(props, PageProperties):
             raise CapyPDFException('Argument is not a PageProperties object.')
-        check_error(libfile.capy_dc_set_custom_page_properties(self, props))
+        check_error(_capy_dc_set_custom_page_properties(self, props))
 
     def annotate(self, annotation_id):
-        check_error(libfile.capy_dc_annotate(self, annotation_id))
+        check_error(_capy_dc_annotate(self, annotation_id))
 
 class ColorPatternDrawContext(DrawContextBase):
 
     def __init__(self, generator, w, h):
         super().__init__(generator)
-        dcptr = ctypes.c_void_p()
-        check_error(libfile.capy_color_pattern_context_new(generator, ctypes.pointer(dcptr), w, h))
+        dcptr = _c_void_p()
+        check_error(_capy_color_pattern_context_new(generator, _byref(dcptr), w, h))
         self._as_parameter_ = dcptr
+        _register_destructor(self, _capy_dc_destroy)
 
 class FormXObjectDrawContext(DrawContextBase):
 
     def __init__(self, generator, w, h):
         super().__init__(generator)
-        dcptr = ctypes.c_void_p()
-        check_error(libfile.capy_form_xobject_new(generator, w, h, ctypes.pointer(dcptr)))
+        dcptr = _c_void_p()
+        check_error(_capy_form_xobject_new(generator, w, h, _byref(dcptr)))
         self._as_parameter_ = dcptr
+        _register_destructor(self, _capy_dc_destroy)
 
 
 class StateContextManager:
@@ -869,6 +1016,157 @@ class StateContextManager:
     def __exit__(self, exc_type, exc_value, exc_tb):
         self.ctx.cmd_Q()
 
+# Collects drawing commands and sends them to the draw context in one
+# call. Errors in the buffered commands are raised from flush(). The
+# commands before the failing one have then already been applied and the
+# ones after it are discarded. Commands given directly to the draw context
+# while a buffer is open are not ordered with the buffer: they end up
+# before everything that is still waiting in it. A command with a bad
+# operand raises immediately and leaves the buffer unchanged.
+#
+# A buffer is open from its creation until its with block ends
+# successfully. The generator flushes all open buffers of a draw context
+# before adding it to the document, so commands are not lost if flush() is
+# never called or the with block raised. After its with block has ended,
+# the buffer must be flushed manually.
+class CommandBuffer:
+
+    def __init__(self, dc):
+        self.dc = dc
+        self.ops = array('B')
+        self.operands = array('d')
+        dc._command_buffers.append(self)
+
+    def __enter__(self):
+        if self not in self.dc._command_buffers:
+            self.dc._command_buffers.append(self)
+        return self
+
+    def __exit__(self, exc_type, exc_value, exc_tb):
+        if exc_type is None:
+            self.flush()
+            self.dc._command_buffers.remove(self)
+
+    def flush(self):
+        if not self.ops:
+            return
+        ops_address, num_ops = self.ops.buffer_info()
+        operands_address, num_operands = self.operands.buffer_info()
+        try:
+            check_error(_capy_dc_replay(self.dc, ops_address, num_ops, operands_address, num_operands))
+        finally:
+            self.ops = array('B')
+            self.operands = array('d')
+
+    def cmd_b(self):
+        self.ops.append(_OP_b)
+
+    def cmd_B(self):
+        self.ops.append(_OP_B)
+
+    def cmd_bstar(self):
+        self.ops.append(_OP_bstar)
+
+    def cmd_Bstar(self):
+        self.ops.append(_OP_Bstar)
+
+    def cmd_c(self, x1, y1, x2, y2, x3, y3):
+        vals = array('d', (x1, y1, x2, y2, x3, y3))
+        self.ops.append(_OP_c)
+        self.operands.extend(vals)
+
+    def cmd_cm(self, m1, m2, m3, m4, m5, m6):
+        vals = array('d', (m1, m2, m3, m4, m5, m6))
+        self.ops.append(_OP_cm)
+        self.operands.extend(vals)
+
+    def cmd_f(self):
+        self.ops.append(_OP_f)
+
+    def cmd_fstar(self):
+        self.ops.append(_OP_fstar)
+
+    def cmd_G(self, gray):
+        self.operands.append(gray)
+        self.ops.append(_OP_G)
+
+    def cmd_g(self, gray):
+        self.operands.append(gray)
+        self.ops.append(_OP_g)
+
+    def cmd_h(self):
+        self.ops.append(_OP_h)
+
+    def cmd_k(self, c, m, y, k):
+        vals = array('d', (c, m, y, k))
+        self.ops.append(_OP_k)
+        self.operands.extend(vals)
+
+    def cmd_K(self, c, m, y, k):
+        vals = array('d', (c, m, y, k))
+        self.ops.append(_OP_K)
+        self.operands.extend(vals)
+
+    def cmd_l(self, x, y):
+        vals = array('d', (x, y))
+        self.ops.append(_OP_l)
+        self.operands.extend(vals)
+
+    def cmd_m(self, x, y):
+        vals = array('d', (x, y))
+        self.ops.append(_OP_m)
+        self.operands.extend(vals)
+
+    def cmd_n(self):
+        self.ops.append(_OP_n)
+
+    def cmd_q(self):
+        self.ops.append(_OP_q)
+
+    def cmd_Q(self):
+        self.ops.append(_OP_Q)
+
+    def cmd_re(self, x, y, w, h):
+        vals = array('d', (x, y, w, h))
+        self.ops.append(_OP_re)
+        self.operands.extend(vals)
+
+    def cmd_RG(self, r, g, b):
+        vals = array('d', (r, g, b))
+        self.ops.append(_OP_RG)
+        self.operands.extend(vals)
+
+    def cmd_rg(self, r, g, b):
+        vals = array('d', (r, g, b))
+        self.ops.append(_OP_rg)
+        self.operands.extend(vals)
+
+    def cmd_s(self):
+        self.ops.append(_OP_s)
+
+    def cmd_S(self):
+        self.ops.append(_OP_S)
+
+    def cmd_v(self, x2, y2, x3, y3):
+        vals = array('d', (x2, y2, x3, y3))
+        self.ops.append(_OP_v)
+        self.operands.extend(vals)
+
+    def cmd_w(self, line_width):
+        self.operands.append(line_width)
+        self.ops.append(_OP_w)
+
+    def cmd_W(self):
+        self.ops.append(_OP_W)
+
+    def cmd_Wstar(self):
+        self.ops.append(_OP_Wstar)
+
+    def cmd_y(self, x1, y1, x3, y3):
+        vals = array('d', (x1, y1, x3, y3))
+        self.ops.append(_OP_y)
+        self.operands.extend(vals)
+
 class MarkedContextManager:
 
     def __init__(self, dc):
@@ -883,18 +1181,21 @@ class MarkedContextManager:
         finally:
             self.dc = None # Not very elegant.
 
+# The generator copies its options, so one default object can be shared
+# by every generator that is created without explicit options.
+@functools.lru_cache(maxsize=1)
+def _default_options():
+    return Options()
+
 class Generator:
     def __init__(self, filename, options=None):
         file_name_bytes = to_bytepath(filename)
         if options is None:
-            options = Options()
-        gptr = ctypes.c_void_p()
-        check_error(libfile.capy_generator_new(file_name_bytes, options, ctypes.pointer(gptr)))
+            options = _default_options()
+        gptr = _c_void_p()
+        check_error(_capy_generator_new(file_name_bytes, options, _byref(gptr)))
         self._as_parameter_ = gptr
-
-    def __del__(self):
-        if self._as_parameter_ is not None:
-            check_error(libfile.capy_generator_destroy(self))
+        _register_destructor(self, _capy_generator_destroy)
 
     def __enter__(self):
         return self
@@ -912,55 +1213,58 @@ class Generator:
         return ColorPatternDrawContext(self, w, h)
 
     def add_page(self, page_ctx):
-        check_error(libfile.capy_generator_add_page(self, page_ctx))
+        page_ctx._flush_command_buffers()
+        check_error(_capy_generator_add_page(self, page_ctx))
 
     def add_form_xobject(self, fxo_ctx):
         fxid = FormXObjectId()
-        check_error(libfile.capy_generator_add_form_xobject(self, fxo_ctx, ctypes.pointer(fxid)))
+        fxo_ctx._flush_command_buffers()
+        check_error(_capy_generator_add_form_xobject(self, fxo_ctx, _byref(fxid)))
         return fxid
 
     def add_color_pattern(self, pattern_ctx):
         pid = PatternId()
-        check_error(libfile.capy_generator_add_color_pattern(self, pattern_ctx, ctypes.pointer(pid)))
+        pattern_ctx._flush_command_buffers()
+        check_error(_capy_generator_add_color_pattern(self, pattern_ctx, _byref(pid)))
         return pid
 
     def embed_jpg(self, fname, interpolate=ImageInterpolation.Automatic):
         if not isinstance(interpolate, ImageInterpolation):
             raise CapyPDFException('Argument must be an image interpolation.')
         iid = ImageId()
-        check_error(libfile.capy_generator_embed_jpg(self, to_bytepath(fname), interpolate.value, ctypes.pointer(iid)))
+        check_error(_capy_generator_embed_jpg(self, to_bytepath(fname), interpolate.value, _byref(iid)))
         return iid
 
     def embed_file(self, fname):
         fid = EmbeddedFileId()
-        check_error(libfile.capy_generator_embed_file(self, to_bytepath(fname), ctypes.pointer(fid)))
+        check_error(_capy_generator_embed_file(self, to_bytepath(fname), _byref(fid)))
         return fid
 
     def load_font(self, fname):
         fid = FontId()
-        check_error(libfile.capy_generator_load_font(self, to_bytepath(fname), ctypes.pointer(fid)))
+        check_error(_capy_generator_load_font(self, to_bytepath(fname), _byref(fid)))
         return fid
 
     def load_icc_profile(self, fname):
         iid = IccColorSpaceId()
-        check_error(libfile.capy_generator_load_icc_profile(self, to_bytepath(fname), ctypes.pointer(iid)))
+        check_error(_capy_generator_load_icc_profile(self, to_bytepath(fname), _byref(iid)))
         return iid
 
     def add_lab_colorspace(self, xw, yw, zw, amin, amax, bmin, bmax):
         lid = LabColorSpaceId()
-        check_error(libfile.capy_generator_add_lab_colorspace(self, xw, yw, zw, amin, amax, bmin, bmax, ctypes.pointer(lid)))
+        check_error(_capy_generator_add_lab_colorspace(self, xw, yw, zw, amin, amax, bmin, bmax, _byref(lid)))
         return lid
 
     def load_image(self, fname):
-        optr = ctypes.c_void_p()
-        check_error(libfile.capy_generator_load_image(self, to_bytepath(fname), ctypes.pointer(optr)))
+        optr = _c_void_p()
+        check_error(_capy_generator_load_image(self, to_bytepath(fname), _byref(optr)))
         return RasterImage(optr)
 
     def convert_image(self, in_image, output_cs, ri):
         if not isinstance(in_image, RasterImage):
             raise CapyPDFException('First argument must be a RasterImage object.')
-        optr = ctypes.c_void_p()
-        check_error(libfile.capy_generator_convert_image(self, in_image, output_cs.value, ri.value, ctypes.pointer(optr)))
+        optr = _c_void_p()
+        check_error(_capy_generator_convert_image(self, in_image, output_cs.value, ri.value, _byref(optr)))
         return RasterImage(optr)
 
     def add_image(self, ri, params):
@@ -969,42 +1273,42 @@ class Generator:
         if not isinstance(params, ImagePdfProperties):
             raise CapyPDFException('Second argument must be an PDF property object.')
         iid = ImageId()
-        check_error(libfile.capy_generator_add_image(self, ri, params, ctypes.pointer(iid)))
+        check_error(_capy_generator_add_image(self, ri, params, _byref(iid)))
         return iid
 
     def add_type2_function(self, type2func):
         if not isinstance(type2func, Type2Function):
             raise CapyPDFException('Argument must be a function.')
         fid = FunctionId()
-        check_error(libfile.capy_generator_add_type2_function(self, type2func, ctypes.pointer(fid)))
+        check_error(_capy_generator_add_type2_function(self, type2func, _byref(fid)))
         return fid
 
     def add_type2_shading(self, type2shade):
         if not isinstance(type2shade, Type2Shading):
             raise CapyPDFException('Argument must be a type 2 shading object.')
         shid = ShadingId()
-        check_error(libfile.capy_generator_add_type2_shading(self, type2shade, ctypes.pointer(shid)))
+        check_error(_capy_generator_add_type2_shading(self, type2shade, _byref(shid)))
         return shid
 
     def add_type3_shading(self, type3shade):
         if not isinstance(type3shade, Type3Shading):
             raise CapyPDFException('Argument must be a type 3 shading object.')
         shid = ShadingId()
-        check_error(libfile.capy_generator_add_type3_shading(self, type3shade, ctypes.pointer(shid)))
+        check_error(_capy_generator_add_type3_shading(self, type3shade, _byref(shid)))
         return shid
 
     def add_type4_shading(self, type4shade):
         if not isinstance(type4shade, Type4Shading):
             raise CapyPDFException('Argument must be a type 4 shading object.')
         shid = ShadingId()
-        check_error(libfile.capy_generator_add_type4_shading(self, type4shade, ctypes.pointer(shid)))
+        check_error(_capy_generator_add_type4_shading(self, type4shade, _byref(shid)))
         return shid
 
     def add_type6_shading(self, type6shade):
         if not isinstance(type6shade, Type6Shading):
             raise CapyPDFException('Argument must be a type 4 shading object.')
         shid = ShadingId()
-        check_error(libfile.capy_generator_add_type6_shading(self, type6shade, ctypes.pointer(shid)))
+        check_error(_capy_generator_add_type6_shading(self, type6shade, _byref(shid)))
         return shid
 
     def add_structure_item(self, struct_type, parent=None, extra=None):
@@ -1013,7 +1317,7 @@ class Generator:
         else:
             if not isinstance(parent, StructureItemId):
                 raise CapyPDFException('Parent argument must be a StructureItemID or None.')
-            parentptr = ctypes.pointer(parent)
+            parentptr = _pointer(parent)
         if extra is None:
             extraptr = None
         else:
@@ -1022,9 +1326,9 @@ class Generator:
             extraptr = extra._as_parameter_
         stid = StructureItemId()
         if isinstance(struct_type, StructureType):
-            check_error(libfile.capy_generator_add_structure_item(self, struct_type.value, parentptr, extraptr, ctypes.pointer(stid)))
+            check_error(_capy_generator_add_structure_item(self, struct_type.value, parentptr, extraptr, _byref(stid)))
         elif isinstance(struct_type, RoleId):
-            check_error(libfile.capy_generator_add_custom_structure_item(self, struct_type, parentptr, extraptr, ctypes.pointer(stid)))
+            check_error(_capy_generator_add_custom_structure_item(self, struct_type, parentptr, extraptr, _byref(stid)))
         else:
             raise CapyPDFException('First argument must be a structure item or role id.')
         return stid
@@ -1035,11 +1339,11 @@ class Generator:
             raise CapyPDFException('Color argument must be a color object.')
         sepid = SeparationId()
         text_bytes = name.encode('UTF-8')
-        check_error(libfile.capy_generator_create_separation_simple(self, text_bytes, color, ctypes.pointer(sepid)))
+        check_error(_capy_generator_create_separation_simple(self, text_bytes, color, _byref(sepid)))
         return sepid
 
     def write(self):
-        check_error(libfile.capy_generator_write(self))
+        check_error(_capy_generator_write(self))
 
     def text_width(self, text, font, pointsize):
         if not isinstance(text, str):
@@ -1048,31 +1352,31 @@ class Generator:
             raise CapyPDFException('Font argument is not a font id.')
         w = ctypes.c_double()
         bytes = text.encode('UTF-8')
-        check_error(libfile.capy_generator_text_width(self, bytes, font, pointsize, ctypes.pointer(w)))
+        check_error(_capy_generator_text_width(self, bytes, font, pointsize, _byref(w)))
         return w.value
 
     def add_graphics_state(self, gs):
         if not isinstance(gs, GraphicsState):
             raise CapyPDFException('Argument must be a graphics state object.')
         gsid = GraphicsStateId()
-        check_error(libfile.capy_generator_add_graphics_state(self, gs, ctypes.pointer(gsid)))
+        check_error(_capy_generator_add_graphics_state(self, gs, _byref(gsid)))
         return gsid
 
     def add_outline(self, outline):
         if not isinstance(outline, Outline):
             raise CapyPDFException('Argument must be an outline object.')
         oid = OutlineId()
-        check_error(libfile.capy_generator_add_outline(self, outline, ctypes.pointer(oid)))
+        check_error(_capy_generator_add_outline(self, outline, _byref(oid)))
         return oid
 
     def add_optional_content_group(self, ocg):
         ocgid = OptionalContentGroupId()
-        check_error(libfile.capy_generator_add_optional_content_group(self, ocg, ctypes.pointer(ocgid)))
+        check_error(_capy_generator_add_optional_content_group(self, ocg, _byref(ocgid)))
         return ocgid
 
     def create_annotation(self, annotation):
         aid = AnnotationId()
-        check_error(libfile.capy_generator_create_annotation(self, annotation, ctypes.pointer(aid)))
+        check_error(_capy_generator_create_annotation(self, annotation, _byref(aid)))
         return aid
 
     def add_rolemap_entry(self, name, builtin_type):
@@ -1080,52 +1384,50 @@ class Generator:
             raise CapyPDFException('Builtin type must be a StructureType.')
         roid = RoleId()
         name_bytes = name.encode('ASCII')
-        check_error(libfile.capy_generator_add_rolemap_entry(self, name_bytes, builtin_type.value, ctypes.pointer(roid)))
+        check_error(_capy_generator_add_rolemap_entry(self, name_bytes, builtin_type.value, _byref(roid)))
         return roid
 
 
 class TextSequence:
     def __init__(self):
-        opt = ctypes.c_void_p()
-        check_error(libfile.capy_text_sequence_new(ctypes.pointer(opt)))
+        opt = _c_void_p()
+        check_error(_capy_text_sequence_new(_byref(opt)))
         self._as_parameter_ = opt
-
-    def __del__(self):
-        check_error(libfile.capy_text_sequence_destroy(self))
+        _register_destructor(self, _capy_text_sequence_destroy)
 
     def append_codepoint(self, codepoint):
         if not isinstance(codepoint, int):
             codepoint = ord(codepoint)
-        check_error(libfile.capy_text_sequence_append_codepoint(self, codepoint))
+        check_error(_capy_text_sequence_append_codepoint(self, codepoint))
 
     def append_kerning(self, kern):
-        check_error(libfile.capy_text_sequence_append_kerning(self, kern))
+        check_error(_capy_text_sequence_append_kerning(self, kern))
 
     def append_actualtext_start(self, txt):
-        check_error(libfile.capy_text_sequence_append_actualtext_start(self, txt.encode('UTF-8')))
+        check_error(_capy_text_sequence_append_actualtext_start(self, txt.encode('UTF-8')))
 
     def append_actualtext_end(self):
-        check_error(libfile.capy_text_sequence_append_actualtext_end(self))
+        check_error(_capy_text_sequence_append_actualtext_end(self))
 
     def append_raw_glyph(self, glyph_id, codepoint):
         if not isinstance(codepoint, int):
             codepoint = ord(codepoint)
-        check_error(libfile.capy_text_sequence_append_raw_glyph(self, glyph_id, codepoint))
+        check_error(_capy_text_sequence_append_raw_glyph(self, glyph_id, codepoint))
 
     def append_ligature_glyph(self, glyph_id, txt):
         u8txt = txt.encode('UTF-8')
-        check_error(libfile.capy_text_sequence_append_ligature_glyph(self, glyph_id, u8txt))
+        check_error(_capy_text_sequence_append_ligature_glyph(self, glyph_id, u8txt))
 
 
 class Text:
     def __init__(self, dc):
         if not isinstance(dc, DrawContext):
             raise CapyPDFException('Argument must be a DrawingContext (preferably use its .text_new() method instead).')
-        self._as_parameter_ = None
-        opt = ctypes.c_void_p()
-        check_error(libfile.capy_dc_text_new(dc, ctypes.pointer(opt)))
+        opt = _c_void_p()
+        check_error(_capy_dc_text_new(dc, _byref(opt)))
         self._as_parameter_ = opt
         self.dc = dc
+        _register_destructor(self, _capy_text_destroy)
 
     def __enter__(self):
         return self
@@ -1136,254 +1438,221 @@ class Text:
         finally:
             self.dc = None # Not very elegant.
 
-    def __del__(self):
-        if self._as_parameter_ is not None:
-            check_error(libfile.capy_text_destroy(self))
-
     def render_text(self, text):
         if not isinstance(text, str):
             raise CapyPDFException('Text must be a Unicode string.')
         bytes = text.encode('UTF-8')
-        check_error(libfile.capy_text_render_text(self, bytes))
+        check_error(_capy_text_render_text(self, bytes))
 
     def set_nonstroke(self, color):
-        check_error(libfile.capy_text_set_nonstroke(self, color))
+        check_error(_capy_text_set_nonstroke(self, color))
 
     def set_stroke(self, color):
-        check_error(libfile.capy_text_set_stroke(self, color))
+        check_error(_capy_text_set_stroke(self, color))
 
     def cmd_BDC_builtin(self, struct_id):
-        check_error(libfile.capy_text_cmd_BDC_builtin(self, struct_id))
+        check_error(_capy_text_cmd_BDC_builtin(self, struct_id))
         return MarkedContextManager(self)
 
     def cmd_EMC(self):
-        check_error(libfile.capy_text_cmd_EMC(self))
+        check_error(_capy_text_cmd_EMC(self))
 
     def cmd_Tc(self, spacing):
-        check_error(libfile.capy_text_cmd_Tc(self, spacing))
+        check_error(_capy_text_cmd_Tc(self, spacing))
 
     def cmd_Td(self, x, y):
-        check_error(libfile.capy_text_cmd_Td(self, x, y))
+        check_error(_capy_text_cmd_Td(self, x, y))
 
     def cmd_Tf(self, fontid, ptsize):
         if not isinstance(fontid, FontId):
             raise CapyPDFException('Font id is not a font object.')
-        check_error(libfile.capy_text_cmd_Tf(self, fontid, ptsize))
+        check_error(_capy_text_cmd_Tf(self, fontid, ptsize))
 
     def cmd_TL(self, leading):
-        check_error(libfile.capy_text_cmd_TL(self, leading))
+        check_error(_capy_text_cmd_TL(self, leading))
 
     def cmd_TJ(self, seq):
         if not isinstance(seq, TextSequence):
             raise CapyPDFException('Argument must be a kerning sequence.')
-        check_error(libfile.capy_text_cmd_TJ(self, seq))
+        check_error(_capy_text_cmd_TJ(self, seq))
 
     def cmd_Tm(self, a, b, c, d, e, f):
-        check_error(libfile.capy_text_cmd_Tm(self, a, b, c, d, e, f))
+        check_error(_capy_text_cmd_Tm(self, a, b, c, d, e, f))
 
     def cmd_Tr(self, rendtype):
         if not isinstance(rendtype, TextMode):
             raise CapyPDFException('Argument must be a text mode.')
-        check_error(libfile.capy_text_cmd_Tr(self, rendtype.value))
+        check_error(_capy_text_cmd_Tr(self, rendtype.value))
 
     def cmd_Tw(self, spacing):
-        check_error(libfile.capy_text_cmd_Tw(self, spacing))
+        check_error(_capy_text_cmd_Tw(self, spacing))
 
     def cmd_Tstar(self):
-        check_error(libfile.capy_text_cmd_Tstar(self))
+        check_error(_capy_text_cmd_Tstar(self))
 
 class Color:
     def __init__(self):
-        self._as_parameter_ = None
-        opt = ctypes.c_void_p()
-        check_error(libfile.capy_color_new(ctypes.pointer(opt)))
+        opt = _c_void_p()
+        check_error(_capy_color_new(_byref(opt)))
         self._as_parameter_ = opt
-
-    def __del__(self):
-        if self._as_parameter_ is not None:
-            check_error(libfile.capy_color_destroy(self))
+        _register_destructor(self, _capy_color_destroy)
 
     def get_underlying(self):
         return self._as_parameter_
 
     def set_rgb(self, r, g, b):
-        check_error(libfile.capy_color_set_rgb(self, r, g, b))
+        check_error(_capy_color_set_rgb(self, r, g, b))
 
     def set_gray(self, g):
-        check_error(libfile.capy_color_set_gray(self, g))
+        check_error(_capy_color_set_gray(self, g))
 
     def set_cmyk(self, c, m, y, k):
-        check_error(libfile.capy_color_set_cmyk(self, c, m, y, k))
+        check_error(_capy_color_set_cmyk(self, c, m, y, k))
 
     def set_icc(self, icc_id, values):
-        check_error(libfile.capy_color_set_icc(self, icc_id, *to_array(ctypes.c_double, values)))
+        check_error(_capy_color_set_icc(self, icc_id, *to_array(ctypes.c_double, values)))
 
     def set_separation(self, sepid, value):
-        check_error(libfile.capy_color_set_separation(self, sepid, value))
+        check_error(_capy_color_set_separation(self, sepid, value))
 
     def set_pattern(self, pattern_id):
-        check_error(libfile.capy_color_set_pattern(self, pattern_id))
+        check_error(_capy_color_set_pattern(self, pattern_id))
 
     def set_lab(self, lab_id, l, a, b):
-        check_error(libfile.capy_color_set_lab(self, lab_id, l, a, b))
+        check_error(_capy_color_set_lab(self, lab_id, l, a, b))
 
 class Transition:
     def __init__(self):
-        self._as_parameter_ = None
-        opt = ctypes.c_void_p()
-        check_error(libfile.capy_transition_new(ctypes.pointer(opt)))
+        opt = _c_void_p()
+        check_error(_capy_transition_new(_byref(opt)))
         self._as_parameter_ = opt
+        _register_destructor(self, _capy_transition_destroy)
 
     def set_S(self, S):
         if not isinstance(S, TransitionType):
             raise CapyPDFException('Argument is not a transition type.')
-        check_error(libfile.capy_transition_set_S(self, S.value))
+        check_error(_capy_transition_set_S(self, S.value))
 
     def set_D(self, d):
-        check_error(libfile.capy_transition_set_D(self, d))
+        check_error(_capy_transition_set_D(self, d))
 
     def set_Dn(self, dm):
-        check_error(libfile.capy_transition_set_Dm(self, Dm.value))
+        check_error(_capy_transition_set_Dm(self, Dm.value))
 
     def set_M(self, m):
-        check_error(libfile.capy_transition_set_M(self, M.value))
+        check_error(_capy_transition_set_M(self, M.value))
 
     def set_Di(self, Di):
-        check_error(libfile.capy_transition_set_Di(self, Di))
+        check_error(_capy_transition_set_Di(self, Di))
 
     def set_SS(self, ss):
-        check_error(libfile.capy_transition_set_SS(self, ss))
+        check_error(_capy_transition_set_SS(self, ss))
 
     def set_B(self, B):
-        check_error(libfile.capy_transition_set_S(self, int(B)))
-
-
-    def __del__(self):
-        check_error(libfile.capy_transition_destroy(self))
+        check_error(_capy_transition_set_S(self, int(B)))
 
 class RasterImage:
-    def __init__(self, cptr = None):
-        if cptr is None:
-            self._as_parameter_ = None
-            opt = ctypes.c_void_p()
-            check_error(libfile.capy_raster_image_new(ctypes.pointer(opt)))
-            self._as_parameter_ = opt
-        else:
-            self._as_parameter_ = cptr
-
-    def __del__(self):
-        check_error(libfile.capy_raster_image_destroy(self))
+    # Raster images are only created by RasterImageBuilder.build() and the
+    # Generator image loaders, there is no C function for an empty one.
+    def __init__(self, cptr):
+        self._as_parameter_ = cptr
+        _register_destructor(self, _capy_raster_image_destroy)
 
     def get_colorspace(self):
         val = enum_type(99)
-        check_error(libfile.capy_raster_image_get_colorspace(self, ctypes.pointer(val)))
+        check_error(_capy_raster_image_get_colorspace(self, _byref(val)))
         return ImageColorspace(val.value)
 
     def has_profile(self):
         val = ctypes.c_int32(99)
-        check_error(libfile.capy_raster_image_has_profile(self, ctypes.pointer(val)))
+        check_error(_capy_raster_image_has_profile(self, _byref(val)))
         return True if val.value != 0 else False
 
 class RasterImageBuilder:
     def __init__(self, cptr = None):
         if cptr is None:
-            self._as_parameter_ = None
-            opt = ctypes.c_void_p()
-            check_error(libfile.capy_raster_image_builder_new(ctypes.pointer(opt)))
+            opt = _c_void_p()
+            check_error(_capy_raster_image_builder_new(_byref(opt)))
             self._as_parameter_ = opt
         else:
             self._as_parameter_ = cptr
-
-    def __del__(self):
-        check_error(libfile.capy_raster_image_builder_destroy(self))
+        _register_destructor(self, _capy_raster_image_builder_destroy)
 
     def set_size(self, w, h):
-        check_error(libfile.capy_raster_image_builder_set_size(self, w, h))
+        check_error(_capy_raster_image_builder_set_size(self, w, h))
 
     def set_pixel_data(self, pixels):
         if not isinstance(pixels, bytes):
             raise CapyPDFException('Pixel data must be in bytes.')
-        check_error(libfile.capy_raster_image_builder_set_pixel_data(self, pixels, len(pixels)))
+        check_error(_capy_raster_image_builder_set_pixel_data(self, pixels, len(pixels)))
 
     def set_compression(self, compression):
         if not isinstance(compression, Compression):
             raise CapyPDFException('Compression argument must be enum value.')
-        check_error(libfile.capy_raster_image_builder_set_compression(self, compression.value))
+        check_error(_capy_raster_image_builder_set_compression(self, compression.value))
 
 
     def build(self):
-        opt = ctypes.c_void_p()
-        check_error(libfile.capy_raster_image_builder_build(self, ctypes.pointer(opt)))
+        opt = _c_void_p()
+        check_error(_capy_raster_image_builder_build(self, _byref(opt)))
         return RasterImage(opt)
 
 
 class GraphicsState:
     def __init__(self):
-        self._as_parameter_ = None
-        opt = ctypes.c_void_p()
-        check_error(libfile.capy_graphics_state_new(ctypes.pointer(opt)))
+        opt = _c_void_p()
+        check_error(_capy_graphics_state_new(_byref(opt)))
         self._as_parameter_ = opt
-
-    def __del__(self):
-        check_error(libfile.capy_graphics_state_destroy(self))
+        _register_destructor(self, _capy_graphics_state_destroy)
 
     def set_CA(self, value):
-        check_error(libfile.capy_graphics_state_set_CA(self, value))
+        check_error(_capy_graphics_state_set_CA(self, value))
 
     def set_ca(self, value):
-        check_error(libfile.capy_graphics_state_set_ca(self, value))
+        check_error(_capy_graphics_state_set_ca(self, value))
 
     def set_BM(self, blendmode):
-        check_error(libfile.capy_graphics_state_set_BM(self, blendmode.value))
+        check_error(_capy_graphics_state_set_BM(self, blendmode.value))
 
     def set_op(self, value):
         value = 1 if value else 0
-        check_error(libfile.capy_graphics_state_set_op(self, value))
+        check_error(_capy_graphics_state_set_op(self, value))
 
     def set_OP(self, value):
         value = 1 if value else 0
-        check_error(libfile.capy_graphics_state_set_OP(self, value))
+        check_error(_capy_graphics_state_set_OP(self, value))
 
     def set_OPM(self, value):
-        check_error(libfile.capy_graphics_state_set_OPM(self, value))
+        check_error(_capy_graphics_state_set_OPM(self, value))
 
     def set_TK(self, value):
         value = 1 if value else 0
-        check_error(libfile.capy_graphics_state_set_TK(self, value))
+        check_error(_capy_graphics_state_set_TK(self, value))
 
 
 class OptionalContentGroup:
     def __init__(self, name):
-        self._as_parameter_ = None
         in_bytes = name.encode('ASCII')
-        opt = ctypes.c_void_p()
-        check_error(libfile.capy_optional_content_group_new(ctypes.pointer(opt), in_bytes))
+        opt = _c_void_p()
+        check_error(_capy_optional_content_group_new(_byref(opt), in_bytes))
         self._as_parameter_ = opt
-
-    def __del__(self):
-        check_error(libfile.capy_optional_content_group_destroy(self))
+        _register_destructor(self, _capy_optional_content_group_destroy)
 
 class Type2Function:
     def __init__(self, domain, c1, c2, n):
-        self._as_parameter_ = None
-        t2f = ctypes.c_void_p()
-        check_error(libfile.capy_type2_function_new(*to_array(ctypes.c_double, domain), c1, c2, n, ctypes.pointer(t2f)))
+        t2f = _c_void_p()
+        check_error(_capy_type2_function_new(*to_array(ctypes.c_double, domain), c1, c2, n, _byref(t2f)))
         self._as_parameter_ = t2f
-
-    def __del__(self):
-        check_error(libfile.capy_type2_function_destroy(self))
+        _register_destructor(self, _capy_type2_function_destroy)
 
 class Type2Shading:
     def __init__(self, cs, x0, y0, x1, y1, funcid, extend1, extend2):
         e1 = 1 if extend1 else 0
         e2 = 1 if extend2 else 0
-        self._as_parameter_ = None
-        t2s = ctypes.c_void_p()
-        check_error(libfile.capy_type2_shading_new(cs.value, x0, y0, x1, y1, funcid, e1, e2, ctypes.pointer(t2s)))
+        t2s = _c_void_p()
+        check_error(_capy_type2_shading_new(cs.value, x0, y0, x1, y1, funcid, e1, e2, _byref(t2s)))
         self._as_parameter_ = t2s
-
-    def __del__(self):
-        check_error(libfile.capy_type2_shading_destroy(self))
+        _register_destructor(self, _capy_type2_shading_destroy)
 
 class Type3Shading:
     def __init__(self, cs, coords, funcid, extend1, extend2):
@@ -1391,24 +1660,19 @@ class Type3Shading:
         e2 = 1 if extend2 else 0
         if len(coords) != 6:
             raise CapyPDFException('Coords array must hold exactly 6 doubles.')
-        self._as_parameter_ = None
-        t3s = ctypes.c_void_p()
-        check_error(libfile.capy_type3_shading_new(cs.value, to_array(ctypes.c_double, coords)[0], funcid, e1, e2, ctypes.pointer(t3s)))
+        t3s = _c_void_p()
+        check_error(_capy_type3_shading_new(cs.value, to_array(ctypes.c_double, coords)[0], funcid, e1, e2, _byref(t3s)))
         self._as_parameter_ = t3s
-
-    def __del__(self):
-        check_error(libfile.capy_type3_shading_destroy(self))
+        _register_destructor(self, _capy_type3_shading_destroy)
 
 
 class Type4Shading:
     def __init__(self, cs, minx, miny, maxx, maxy):
-        t4s = ctypes.c_void_p()
-        check_error(libfile.capy_type4_shading_new(cs.value,
-                    minx, miny, maxx, maxy, ctypes.pointer(t4s)))
+        t4s = _c_void_p()
+        check_error(_capy_type4_shading_new(cs.value,
+                    minx, miny, maxx, maxy, _byref(t4s)))
         self._as_parameter_ = t4s
-
-    def __del__(self):
-        check_error(libfile.capy_type4_shading_destroy(self))
+        _register_destructor(self, _capy_type4_shading_destroy)
 
     def add_triangle(self, coords, colors):
         if len(coords) != 6:
@@ -1416,7 +1680,7 @@ class Type4Shading:
         if len(colors) != 3:
             raise CapyPDFException('Must have exactly 3 colors.')
         colorptrs = [x.get_underlying() for x in colors]
-        check_error(libfile.capy_type4_shading_add_triangle(self,
+        check_error(_capy_type4_shading_add_triangle(self,
                     to_array(ctypes.c_double, coords)[0],
                     to_array(ctypes.c_void_p, colorptrs)[0]))
 
@@ -1426,7 +1690,7 @@ class Type4Shading:
                 raise CapyPDFException('Color argument not a color object.')
             if len(coords) != 2:
                 raise CapyPDFException('Must have exactly 2 floats.')
-            check_error(libfile.capy_type4_shading_extend(self,
+            check_error(_capy_type4_shading_extend(self,
                         flag,
                         to_array(ctypes.c_double, coords)[0],
                         color))
@@ -1436,13 +1700,11 @@ class Type4Shading:
 
 class Type6Shading:
     def __init__(self, cs, minx, miny, maxx, maxy):
-        t6s = ctypes.c_void_p()
-        check_error(libfile.capy_type6_shading_new(cs.value,
-                    minx, miny, maxx, maxy, ctypes.pointer(t6s)))
+        t6s = _c_void_p()
+        check_error(_capy_type6_shading_new(cs.value,
+                    minx, miny, maxx, maxy, _byref(t6s)))
         self._as_parameter_ = t6s
-
-    def __del__(self):
-        check_error(libfile.capy_type6_shading_destroy(self))
+        _register_destructor(self, _capy_type6_shading_destroy)
 
     def add_patch(self, coords, colors):
         if len(coords) != 24:
@@ -1450,7 +1712,7 @@ class Type6Shading:
         if len(colors) != 4:
             raise CapyPDFException('Must have exactly 4 colors.')
         colorptrs = [x.get_underlying() for x in colors]
-        check_error(libfile.capy_type6_shading_add_patch(self,
+        check_error(_capy_type6_shading_add_patch(self,
                     to_array(ctypes.c_double, coords)[0],
                     to_array(ctypes.c_void_p, colorptrs)[0]))
 
@@ -1461,7 +1723,7 @@ class Type6Shading:
             if len(colors) != 2:
                 raise CapyPDFException('Must have exactly 2 colors.')
             colorptrs = [x.get_underlying() for x in colors]
-            check_error(libfile.capy_type6_shading_extend(self,
+            check_error(_capy_type6_shading_extend(self,
                         flag,
                         to_array(ctypes.c_double, coords)[0],
                         to_array(ctypes.c_void_p, colorptrs)[0]))
@@ -1471,129 +1733,119 @@ class Type6Shading:
 class Annotation:
     def __init__(self, handle):
         self._as_parameter_ = handle
-
-    def __del__(self):
-        check_error(libfile.capy_annotation_destroy(self))
+        _register_destructor(self, _capy_annotation_destroy)
 
     def set_rectangle(self, x1, y1, x2, y2):
-        check_error(libfile.capy_annotation_set_rectangle(self, x1, y1, x2, y2))
+        check_error(_capy_annotation_set_rectangle(self, x1, y1, x2, y2))
 
     def set_flags(self, flags):
         if not isinstance(flags, AnnotationFlag):
             raise CapyPDFException('Flag argument is not an AnnotationFlag.')
-        check_error(libfile.capy_annotation_set_flags(self, flags.value ))
+        check_error(_capy_annotation_set_flags(self, flags.value ))
 
     @classmethod
     def new_text_annotation(cls, text):
-        ta = ctypes.c_void_p()
-        check_error(libfile.capy_text_annotation_new(text.encode('utf-8'), ctypes.pointer(ta)))
+        ta = _c_void_p()
+        check_error(_capy_text_annotation_new(text.encode('utf-8'), _byref(ta)))
         return Annotation(ta)
 
     @classmethod
     def new_file_attachment_annotation(cls, fid):
-        ta = ctypes.c_void_p()
-        check_error(libfile.capy_file_attachment_annotation_new(fid, ctypes.pointer(ta)))
+        ta = _c_void_p()
+        check_error(_capy_file_attachment_annotation_new(fid, _byref(ta)))
         return Annotation(ta)
 
     @classmethod
     def new_printers_mark_annotation(cls, fid):
-        ta = ctypes.c_void_p()
-        check_error(libfile.capy_printers_mark_annotation_new(fid, ctypes.pointer(ta)))
+        ta = _c_void_p()
+        check_error(_capy_printers_mark_annotation_new(fid, _byref(ta)))
         return Annotation(ta)
 
 class StructItemExtraData:
     def __init__(self):
-        ed = ctypes.c_void_p()
-        check_error(libfile.capy_struct_item_extra_data_new(ctypes.pointer(ed)))
+        ed = _c_void_p()
+        check_error(_capy_struct_item_extra_data_new(_byref(ed)))
         self._as_parameter_ = ed
-
-    def __del__(self):
-        check_error(libfile.capy_struct_item_extra_data_destroy(self))
+        _register_destructor(self, _capy_struct_item_extra_data_destroy)
 
     def set_t(self, T):
         chars = T.encode('UTF-8')
-        check_error(libfile.capy_struct_item_extra_data_set_t(self, chars))
+        check_error(_capy_struct_item_extra_data_set_t(self, chars))
 
     def set_lang(self, lang):
         chars = lang.encode('UTF-8')
-        check_error(libfile.capy_struct_item_extra_data_set_lang(self, chars))
+        check_error(_capy_struct_item_extra_data_set_lang(self, chars))
 
     def set_alt(self, alt):
         chars = alt.encode('UTF-8')
-        check_error(libfile.capy_struct_item_extra_data_set_alt(self, chars))
+        check_error(_capy_struct_item_extra_data_set_alt(self, chars))
 
     def set_actual_text(self, actual):
         chars = actual.encode('UTF-8')
-        check_error(libfile.capy_struct_item_extra_data_set_actual_text(self, chars))
+        check_error(_capy_struct_item_extra_data_set_actual_text(self, chars))
 
 class ImagePdfProperties:
     def __init__(self):
-        ed = ctypes.c_void_p()
-        check_error(libfile.capy_image_pdf_properties_new(ctypes.pointer(ed)))
+        ed = _c_void_p()
+        check_error(_capy_image_pdf_properties_new(_byref(ed)))
         self._as_parameter_ = ed
-
-    def __del__(self):
-        check_error(libfile.capy_image_pdf_properties_destroy(self))
+        _register_destructor(self, _capy_image_pdf_properties_destroy)
 
     def set_mask(self, boolval):
         intval = 1 if boolval else 0
-        check_error(libfile.capy_image_pdf_properties_set_mask(self, intval))
+        check_error(_capy_image_pdf_properties_set_mask(self, intval))
 
     def set_interpolate(self, ival):
         if not isinstance(ival, ImageInterpolation):
             raise CapyPDFException('Argument must be image interpolation enum.')
-        check_error(libfile.capy_image_lpdf_properties_set_interpolate(self, ival.value))
+        check_error(_capy_image_pdf_properties_set_interpolate(self, ival.value))
 
 class Destination:
     def __init__(self):
-        d = ctypes.c_void_p()
-        check_error(libfile.capy_destination_new(ctypes.pointer(d)))
+        d = _c_void_p()
+        check_error(_capy_destination_new(_byref(d)))
         self._as_parameter_ = d
-
-    def __del__(self):
-        check_error(libfile.capy_destination_destroy(self))
+        _register_destructor(self, _capy_destination_destroy)
 
     def set_page_fit(self, page_num):
-        check_error(libfile.capy_destination_set_page_fit(self, page_num))
+        check_error(_capy_destination_set_page_fit(self, page_num))
 
     def set_page_xyz(self, page_number, x=None, y=None, z=None):
         xptr = self.double_to_cptr(x)
         yptr = self.double_to_cptr(y)
         zptr = self.double_to_cptr(z)
-        check_error(libfile.capy_destination_set_page_xyz(self, page_number, xptr, yptr, zptr))
+        check_error(_capy_destination_set_page_xyz(self, page_number, xptr, yptr, zptr))
 
     def double_to_cptr(self, value):
         if value is None:
             return None
         d = ctypes.c_double(value)
-        cptr = ctypes.pointer(d)
+        cptr = _pointer(d)
         return cptr
 
 class Outline:
     def __init__(self):
-        o = ctypes.c_void_p()
-        check_error(libfile.capy_outline_new(ctypes.pointer(o)))
+        o = _c_void_p()
+        check_error(_capy_outline_new(_byref(o)))
         self._as_parameter_ = o
-
-    def __del__(self):
-        check_error(libfile.capy_outline_destroy(self))
+        _register_destructor(self, _capy_outline_destroy)
 
     def set_title(self, title):
         ctitle = title.encode('UTF-8')
-        check_error(libfile.capy_outline_set_title(self, ctitle))
+        check_error(_capy_outline_set_title(self, ctitle))
 
     def set_destination(self, dest):
         if not isinstance(dest, Destination):
             raise CapyPDFException('Argument must be a destination object.')
-        check_error(libfile.capy_outline_set_destination(self, dest))
+        check_error(_capy_outline_set_destination(self, dest))
 
     def set_rgb(self, r, g, b):
-        check_error(libfile.capy_outline_set_rgb(self, r, g, b))
+        check_error(_capy_outline_set_rgb(self, r, g, b))
 
     def set_f(self, f):
-        check_error(libfile.capy_outline_set_f(self, f))
+        check_error(_capy_outline_set_f(self, f))
 
     def set_parent(self, parent):
         if not isinstance(parent, OutlineId):
             raise CapyPDFException('Argument must be a parent id.')
-        check_error(libfile.capy_outline_set_parent(self, parent))
+        check_error(_capy_outline_set_parent(self, parent))
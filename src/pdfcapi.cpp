@@ -736,6 +736,26 @@ capy_dc_cmd_re(CapyPDF_DrawContext *ctx, double x, double y, double w, double h)
     return conv_err(c->cmd_re(x, y, w, h));
 }
 
+CAPYPDF_PUBLIC CapyPDF_EC capy_dc_cmd_re_batch(CapyPDF_DrawContext *ctx,
+                                               const double *rects,
+                                               int32_t num_rects) CAPYPDF_NOEXCEPT {
+    auto c = reinterpret_cast<PdfDrawContext *>(ctx);
+    if(num_rects <= 0) {
+        return conv_err(ErrorCode::ZeroLengthArray);
+    }
+    if(!rects) {
+        return conv_err(ErrorCode::ArgIsNull);
+    }
+    for(int32_t i = 0; i < num_rects; ++i) {
+        const double *r = rects + 4 * i;
+        auto rc = c->cmd_re(r[0], r[1], r[2], r[3]);
+        if(!rc) {
+            return conv_err(rc);
+        }
+    }
+    RETNOERR;
+}
+
 CapyPDF_EC capy_dc_cmd_RG(CapyPDF_DrawContext *ctx, double r, double g, double b) CAPYPDF_NOEXCEPT {
     auto c = reinterpret_cast<PdfDrawContext *>(ctx);
     return conv_err(c->cmd_RG(r, g, b));
@@ -796,6 +816,22 @@ CAPYPDF_PUBLIC CapyPDF_EC capy_dc_cmd_y(
     return conv_err(c->cmd_y(x1, y1, x3, y3));
 }
 
+CAPYPDF_PUBLIC CapyPDF_EC capy_dc_replay(CapyPDF_DrawContext *ctx,
+                                         const uint8_t *ops,
+                                         int32_t num_ops,
+                                         const double *operands,
+                                         int32_t num_operands) CAPYPDF_NOEXCEPT {
+    auto c = reinterpret_cast<PdfDrawContext *>(ctx);
+    if(num_ops < 0 || num_operands < 0) {
+        return conv_err(ErrorCode::IndexIsNegative);
+    }
+    if((num_ops > 0 && !ops) || (num_operands > 0 && !operands)) {
+        return conv_err(ErrorCode::ArgIsNull);
+    }
+    return conv_err(c->replay(std::span<const uint8_t>(ops, num_ops),
+                              std::span<const double>(operands, num_operands)));
+}
+
 CAPYPDF_PUBLIC CapyPDF_EC capy_dc_set_stroke(CapyPDF_DrawContext *ctx,
                                              CapyPDF_Color *c) CAPYPDF_NOEXCEPT {
     auto *dc = reinterpret_cast<PdfDrawContext *>(ctx);
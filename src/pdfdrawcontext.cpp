@@ -542,6 +542,141 @@ rvoe<NoReturnValue> PdfDrawContext::cmd_y(double x1, double y1, double x3, doubl
     RETOK;
 }
 
+rvoe<NoReturnValue> PdfDrawContext::replay(std::span<const uint8_t> ops,
+                                           std::span<const double> operands) {
+    size_t operand_pos = 0;
+    auto take_operands = [&](size_t count) -> rvoe<const double *> {
+        if(operand_pos + count > operands.size()) {
+            RETERR(IndexOutOfBounds);
+        }
+        const double *args = operands.data() + operand_pos;
+        operand_pos += count;
+        return args;
+    };
+    for(const auto op : ops) {
+        switch((CapyPDF_Draw_Operation)op) {
+        case CAPY_DRAW_OP_b:
+            ERCV(cmd_b());
+            break;
+        case CAPY_DRAW_OP_B:
+            ERCV(cmd_B());
+            break;
+        case CAPY_DRAW_OP_bstar:
+            ERCV(cmd_bstar());
+            break;
+        case CAPY_DRAW_OP_Bstar:
+            ERCV(cmd_Bstar());
+            break;
+        case CAPY_DRAW_OP_c: {
+            ERC(a, take_operands(6));
+            ERCV(cmd_c(a[0], a[1], a[2], a[3], a[4], a[5]));
+            break;
+        }
+        case CAPY_DRAW_OP_cm: {
+            ERC(a, take_operands(6));
+            ERCV(cmd_cm(a[0], a[1], a[2], a[3], a[4], a[5]));
+            break;
+        }
+        case CAPY_DRAW_OP_f:
+            ERCV(cmd_f());
+            break;
+        case CAPY_DRAW_OP_fstar:
+            ERCV(cmd_fstar());
+            break;
+        case CAPY_DRAW_OP_G: {
+            ERC(a, take_operands(1));
+            ERCV(cmd_G(a[0]));
+            break;
+        }
+        case CAPY_DRAW_OP_g: {
+            ERC(a, take_operands(1));
+            ERCV(cmd_g(a[0]));
+            break;
+        }
+        case CAPY_DRAW_OP_h:
+            ERCV(cmd_h());
+            break;
+        case CAPY_DRAW_OP_k: {
+            ERC(a, take_operands(4));
+            ERCV(cmd_k(a[0], a[1], a[2], a[3]));
+            break;
+        }
+        case CAPY_DRAW_OP_K: {
+            ERC(a, take_operands(4));
+            ERCV(cmd_K(a[0], a[1], a[2], a[3]));
+            break;
+        }
+        case CAPY_DRAW_OP_l: {
+            ERC(a, take_operands(2));
+            ERCV(cmd_l(a[0], a[1]));
+            break;
+        }
+        case CAPY_DRAW_OP_m: {
+            ERC(a, take_operands(2));
+            ERCV(cmd_m(a[0], a[1]));
+            break;
+        }
+        case CAPY_DRAW_OP_n:
+            ERCV(cmd_n());
+            break;
+        case CAPY_DRAW_OP_q:
+            ERCV(cmd_q());
+            break;
+        case CAPY_DRAW_OP_Q:
+            ERCV(cmd_Q());
+            break;
+        case CAPY_DRAW_OP_re: {
+            ERC(a, take_operands(4));
+            ERCV(cmd_re(a[0], a[1], a[2], a[3]));
+            break;
+        }
+        case CAPY_DRAW_OP_RG: {
+            ERC(a, take_operands(3));
+            ERCV(cmd_RG(a[0], a[1], a[2]));
+            break;
+        }
+        case CAPY_DRAW_OP_rg: {
+            ERC(a, take_operands(3));
+            ERCV(cmd_rg(a[0], a[1], a[2]));
+            break;
+        }
+        case CAPY_DRAW_OP_s:
+            ERCV(cmd_s());
+            break;
+        case CAPY_DRAW_OP_S:
+            ERCV(cmd_S());
+            break;
+        case CAPY_DRAW_OP_v: {
+            ERC(a, take_operands(4));
+            ERCV(cmd_v(a[0], a[1], a[2], a[3]));
+            break;
+        }
+        case CAPY_DRAW_OP_w: {
+            ERC(a, take_operands(1));
+            ERCV(cmd_w(a[0]));
+            break;
+        }
+        case CAPY_DRAW_OP_W:
+            ERCV(cmd_W());
+            break;
+        case CAPY_DRAW_OP_Wstar:
+            ERCV(cmd_Wstar());
+            break;
+        case CAPY_DRAW_OP_y: {
+            ERC(a, take_operands(4));
+            ERCV(cmd_y(a[0], a[1], a[2], a[3]));
+            break;
+        }
+        default:
+            RETERR(BadEnum);
+        }
+    }
+    if(operand_pos != operands.size()) {
+        RETERR(IndexOutOfBounds);
+    }
+    RETOK;
+}
+
 rvoe<NoReturnValue> PdfDrawContext::serialize_G(std::back_insert_iterator<std::string> &out,
                                                 std::string_view indent,
                                                 LimitDouble gray) const {
@@ -136,6 +136,9 @@ public:
     rvoe<NoReturnValue> cmd_Wstar();
     rvoe<NoReturnValue> cmd_y(double x1, double y1, double x3, double y3);
 
+    // Runs a sequence of CapyPDF_Draw_Operations, taking their arguments from operands.
+    rvoe<NoReturnValue> replay(std::span<const uint8_t> ops, std::span<const double> operands);
+
     // Command serialization.
     rvoe<NoReturnValue> serialize_G(std::back_insert_iterator<std::string> &out,
                                     std::string_view indent,
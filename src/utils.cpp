@@ -64,15 +64,41 @@ bool is_valid_uf8_character(std::string_view input, size_t cur, const UtfDecodeS
     return true;
 }
 
-void append_glyph_to_utf16be(uint32_t glyph, std::vector<uint16_t> &u16buf) {
+// Most text is plain ASCII, so check eight bytes at a time for
+// high bits before falling back to byte by byte processing.
+size_t ascii_run_length(std::string_view input, size_t start) {
+    const uint64_t high_bits = 0x8080808080808080ULL;
+    size_t i = start;
+    for(; i + sizeof(uint64_t) <= input.size(); i += sizeof(uint64_t)) {
+        uint64_t chunk;
+        memcpy(&chunk, input.data() + i, sizeof(uint64_t));
+        if(chunk & high_bits) {
+            break;
+        }
+    }
+    while(i < input.size() && (unsigned char)input[i] < 0x80) {
+        ++i;
+    }
+    return i - start;
+}
+
+void append_utf16_unit_hex(std::string &out, uint32_t unit) {
+    const char hexdigits[] = "0123456789ABCDEF";
+    out += hexdigits[(unit >> 12) & 0xF];
+    out += hexdigits[(unit >> 8) & 0xF];
+    out += hexdigits[(unit >> 4) & 0xF];
+    out += hexdigits[unit & 0xF];
+}
+
+void append_glyph_as_utf16be_hex(std::string &out, uint32_t glyph) {
     if(glyph < 0x10000) {
-        u16buf.push_back((uint16_t)glyph);
+        append_utf16_unit_hex(out, glyph);
     } else {
         const auto reduced = glyph - 0x10000;
         const auto high_surrogate = (reduced >> 10) + 0xD800;
         const auto low_surrogate = (reduced & 0b1111111111) + 0xDC00;
-        u16buf.push_back((uint16_t)high_surrogate);
-        u16buf.push_back((uint16_t)low_surrogate);
+        append_utf16_unit_hex(out, high_surrogate);
+        append_utf16_unit_hex(out, low_surrogate);
     }
 }
 
@@ -169,18 +195,14 @@ void write_file(const char *ofname, const char *buf, size_t bufsize) {
 }
 
 std::string utf8_to_pdfutf16be(const u8string &input, bool add_adornments) {
-    std::string encoded = add_adornments ? "<FEFF" : ""; // PDF 2.0 spec, 7.9.2.2.1
-
-    auto bi = std::back_inserter(encoded);
-    std::vector<uint16_t> u16buf;
+    std::string encoded;
+    // Every UTF-8 byte produces at most four hex digits.
+    encoded.reserve(4 * input.sv().size() + 6);
+    if(add_adornments) {
+        encoded += "<FEFF"; // PDF 2.0 spec, 7.9.2.2.1
+    }
     for(const auto codepoint : input) {
-        u16buf.clear();
-        append_glyph_to_utf16be(codepoint, u16buf);
-        for(const auto &u16 : u16buf) {
-            const auto *lower_byte = (const unsigned char *)&u16;
-            const auto *upper_byte = lower_byte + 1;
-            std::format_to(bi, "{:02X}{:02X}", *upper_byte, *lower_byte);
-        }
+        append_glyph_as_utf16be_hex(encoded, codepoint);
     }
     if(add_adornments) {
         encoded += '>';
@@ -189,7 +211,6 @@ std::string utf8_to_pdfutf16be(const u8string &input, bool add_adornments) {
 }
 
 bool is_valid_utf8(std::string_view input) {
-    std::vector<uint32_t> glyphs;
     UtfDecodeStep par;
     // clang-format off
     const uint32_t twobyte_header_mask    = 0b11100000;
@@ -202,7 +223,7 @@ bool is_valid_utf8(std::string_view input) {
     for(size_t i = 0; i < input.size(); ++i) {
         const uint32_t code = uint32_t((unsigned char)input[i]);
         if(code < 0x80) {
-            glyphs.push_back(code);
+            i += ascii_run_length(input, i) - 1;
             continue;
         } else if((code & twobyte_header_mask) == twobyte_header_value) {
             par.byte1_data_mask = 0b11111;
@@ -266,15 +287,7 @@ std::string pdfstring_quote(std::string_view raw_string) {
     return result;
 }
 
-bool is_ascii(std::string_view text) {
-    for(const auto c : text) {
-        auto ci = int32_t((unsigned char)c);
-        if(ci > 127) {
-            return false;
-        }
-    }
-    return true;
-}
+bool is_ascii(std::string_view text) { return ascii_run_length(text, 0) == text.size(); }
 
 // As in PDF 2.0 spec 7.3.5
 std::string bytes2pdfstringliteral(std::string_view raw, bool add_slash) {
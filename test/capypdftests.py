@@ -5,6 +5,8 @@
 
 
 import unittest
+import array
+import ctypes
 import os, sys, pathlib, shutil, subprocess
 import PIL.Image, PIL.ImageChops
 
@@ -17,6 +19,9 @@ testdata_dir = source_root / 'testoutput'
 image_dir = source_root / 'images'
 icc_dir = source_root / 'icc'
 sys.path.append(str(source_root / 'python'))
+# Set when the suite runs against the optional extension module.
+if 'CAPYPDF_ACCEL_DIR' in os.environ:
+    sys.path.insert(0, os.environ['CAPYPDF_ACCEL_DIR'])
 
 noto_fontdir = pathlib.Path('/usr/share/fonts/truetype/noto')
 
@@ -24,6 +29,9 @@ sys.argv = sys.argv[0:1] + sys.argv[2:]
 
 import capypdf
 
+if 'CAPYPDF_ACCEL_DIR' in os.environ and capypdf._capypdf_accel is None:
+    sys.exit('Python extension module was requested but could not be loaded.')
+
 def draw_intersect_shape(ctx):
     ctx.cmd_m(50, 90)
     ctx.cmd_l(80, 10)
@@ -118,6 +126,18 @@ class TestPDFCreation(unittest.TestCase):
             with g.page_draw_context() as ctx:
                 ctx.render_text('Av, Tv, kerning yo.', fid, 12, 50, 150)
 
+    @cleanup('bytestext.pdf')
+    def test_text_bytes(self, ofilename):
+        with capypdf.Generator(ofilename) as g:
+            fid = g.load_font(noto_fontdir / 'NotoSans-Regular.ttf')
+            with g.page_draw_context() as ctx:
+                text = 'Bytes are fine too.'.encode('UTF-8')
+                ctx.render_text(text, fid, 12, 50, 150)
+                ctx.render_text(bytearray(text), fid, 12, 50, 130)
+                ctx.render_text(memoryview(text)[:5], fid, 12, 50, 110)
+                with self.assertRaises(capypdf.CapyPDFException):
+                    ctx.render_text(b'\xff\xfe', fid, 12, 50, 90)
+
     def test_error(self):
         ofile = pathlib.Path('delme.pdf')
         if ofile.exists():
@@ -418,6 +438,93 @@ class TestPDFCreation(unittest.TestCase):
                 ctx.cmd_re(0, 0, 160, 90)
                 ctx.cmd_f()
 
+    @cleanup('rectbatch.pdf')
+    def test_rect_batch(self, ofilename):
+        with capypdf.Generator(ofilename) as g:
+            with g.page_draw_context() as ctx:
+                ctx.cmd_rg(0.5, 0.5, 0.5)
+                ctx.draw_rects([(10, 10, 20, 20), (50, 50, 30, 10)])
+                ctx.cmd_f()
+                with self.assertRaises(capypdf.CapyPDFException):
+                    ctx.draw_rects([(10, 10, 20)])
+                with self.assertRaises(capypdf.CapyPDFException) as cm:
+                    ctx.draw_rects([])
+                self.assertEqual(str(cm.exception), 'Array has zero length.')
+                buf = array.array('d', [10, 10, 20, 20, 50, 50, 30, 10])
+                ctx.draw_rects(buf)
+                ctx.draw_rects(memoryview(buf).cast('B').cast('d', (2, 4)))
+                ctx.cmd_f()
+                with self.assertRaises(capypdf.CapyPDFException):
+                    ctx.draw_rects(array.array('d', [10, 10, 20]))
+                ctx.cmd_rects_from_buffer(buf, 2)
+                ctx.cmd_f()
+                with self.assertRaises(capypdf.CapyPDFException):
+                    ctx.cmd_rects_from_buffer(buf, 3)
+                with self.assertRaises(capypdf.CapyPDFException):
+                    ctx.cmd_rects_from_buffer(array.array('f', [1, 2, 3, 4]), 1)
+                ctx.cmd_rects_from_buffer(memoryview(buf).toreadonly(), 2)
+                ctx.draw_rects(memoryview(buf).toreadonly())
+                ctx.cmd_f()
+
+    @cleanup('argtypes.pdf')
+    def test_argument_types(self, ofilename):
+        # Same errors with and without the extension module.
+        with capypdf.Generator(ofilename) as g:
+            fid = g.load_font(noto_fontdir / 'NotoSans-Regular.ttf')
+            with g.page_draw_context() as ctx:
+                with self.assertRaises(ctypes.ArgumentError):
+                    ctx.cmd_re(10, 10, 20, 'twenty')
+                with self.assertRaises(ctypes.ArgumentError):
+                    ctx.cmd_rg(0.5, 0.5, None)
+                with self.assertRaises(ctypes.ArgumentError):
+                    ctx.cmd_RG(0.5, [], 0.5)
+                with self.assertRaises(ctypes.ArgumentError):
+                    ctx.render_text('Text', fid, 'big', 50, 150)
+                ctx.cmd_re(10, 10, 20, 20)
+                ctx.cmd_f()
+
+    @cleanup('cmdbuffer.pdf')
+    def test_command_buffer(self, ofilename):
+        with capypdf.Generator(ofilename) as g:
+            with g.page_draw_context() as ctx:
+                with ctx.command_buffer() as buf:
+                    buf.cmd_q()
+                    buf.cmd_rg(0.5, 0.5, 0.5)
+                    buf.cmd_re(10, 10, 20, 20)
+                    buf.cmd_f()
+                    buf.cmd_Q()
+                buf = ctx.command_buffer()
+                buf.cmd_Q()
+                with self.assertRaises(capypdf.CapyPDFException):
+                    buf.flush()
+                buf.cmd_m(10, 10)
+                with self.assertRaises(TypeError):
+                    buf.cmd_re(10, 10, 'twenty', 20)
+                self.assertEqual(list(buf.ops), [capypdf.DrawOperation.m])
+                self.assertEqual(list(buf.operands), [10, 10])
+                buf.cmd_l(20, 20)
+                buf.cmd_S()
+                buf.flush()
+                buf.ops.append(255)
+                with self.assertRaises(capypdf.CapyPDFException):
+                    buf.flush()
+                buf.cmd_m(10, 10)
+                buf.operands.append(10)
+                with self.assertRaises(capypdf.CapyPDFException):
+                    buf.flush()
+                buf.cmd_l(10, 10)
+                buf.operands.pop()
+                with self.assertRaises(capypdf.CapyPDFException):
+                    buf.flush()
+                # Never flushed, the page add does it.
+                pending = ctx.command_buffer()
+                pending.cmd_re(30, 30, 10, 10)
+                pending.cmd_f()
+            self.assertEqual(len(pending.ops), 0)
+            with self.assertRaises(capypdf.CapyPDFException):
+                with g.page_draw_context() as ctx:
+                    ctx.command_buffer().cmd_q()
+
     def build_rasterdata(self, maxval):
         ba = bytearray()
         ba.append(maxval//2)
@@ -1230,5 +1337,27 @@ class TestPDFCreation(unittest.TestCase):
                     ctx.scale(50, 50)
                     ctx.draw_image(image)
 
+@unittest.skipIf(capypdf._capypdf_accel is None, 'Python extension module not available.')
+class TestAccel(unittest.TestCase):
+
+    @cleanup('accel.pdf')
+    def test_fast_paths(self, ofilename):
+        with capypdf.Generator(ofilename) as g:
+            fid = g.load_font(noto_fontdir / 'NotoSans-Regular.ttf')
+            with g.page_draw_context() as ctx:
+                ctx.cmd_rg(r=0.5, g=0.5, b=0.5)
+                ctx.cmd_RG(0, 0, 0)
+                ctx.cmd_re(10, 10, w=20, h=20)
+                ctx.cmd_f()
+                for text in ('str', b'bytes', bytearray(b'bytearray'), memoryview(b'memoryview')[1:]):
+                    ctx.render_text(text, fid, 12, 50, 150)
+                ctx.render_text('Keywords', fid, point_size=12, x=50, y=130)
+                with self.assertRaises(capypdf.CapyPDFException):
+                    ctx.render_text(b'\xff\xfe', fid, 12, 50, 110)
+                with self.assertRaises(capypdf.CapyPDFException):
+                    ctx.render_text(42, fid, 12, 50, 110)
+                with self.assertRaises(capypdf.CapyPDFException):
+                    ctx.render_text('No font', 0, 12, 50, 110)
+
 if __name__ == "__main__":
     unittest.main()
@@ -13,6 +13,7 @@ int main() {
     CapyPDF_Options *opt;
     CapyPDF_DrawContext *dc;
     const char *fname = "capy_ctest.pdf";
+    const double rects[8] = {10, 10, 50, 50, 350, 350, 50, 50};
     FILE *f;
     unlink(fname);
     f = fopen(fname, "r");
@@ -51,6 +52,11 @@ int main() {
         return 1;
     }
 
+    if((rc = capy_dc_cmd_re_batch(dc, rects, 2)) != 0) {
+        fprintf(stderr, "%s\n", capy_error_message(rc));
+        return 1;
+    }
+
     if((rc = capy_dc_cmd_f(dc)) != 0) {
         fprintf(stderr, "%s\n", capy_error_message(rc));
         return 1;
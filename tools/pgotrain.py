@@ -0,0 +1,77 @@
+#!/usr/bin/env python3
+
+# SPDX-License-Identifier: Apache-2.0
+# Copyright 2023-2024 Jussi Pakkanen
+
+# Training workload for profile guided optimization builds, see
+# compilepgo.sh. It exercises the calls that dominate typical documents:
+# rectangles, color changes, fills and UTF-8 text.
+
+import pathlib, os, sys
+
+if 'CAPYPDF_SO_OVERRIDE' not in os.environ:
+    os.environ['CAPYPDF_SO_OVERRIDE'] = 'src'
+source_root = pathlib.Path(__file__).parent / '..'
+sys.path.append(str(source_root / 'python'))
+
+try:
+    import capypdf
+except Exception:
+    print('You might need to edit the search paths at the top of this file to get it to find the dependencies.')
+    raise
+
+default_font = pathlib.Path('/usr/share/fonts/truetype/noto/NotoSans-Regular.ttf')
+
+TEXTS = ['Simple ASCII text line.',
+         'Ääkköset ja muut merkit: åäö ÅÄÖ.',
+         'Kerning: AV Tv Yo, ligatures: fi fl ffi.',
+         'Ελληνικά και русский текст.',
+         ]
+
+NUM_PAGES = 20
+PAGE_W = 595
+PAGE_H = 842
+
+def draw_grid(ctx, page):
+    for row in range(40):
+        for col in range(20):
+            ratio = (row * 20 + col + page) % 100 / 100
+            ctx.cmd_rg(ratio, 1.0 - ratio, 0.5)
+            ctx.cmd_re(20 + col * 28, 20 + row * 20, 25, 15)
+            ctx.cmd_f()
+
+def draw_batched(ctx):
+    rects = [(x * 10, 800, 8, 8) for x in range(50)]
+    ctx.cmd_RG(0.0, 0.0, 0.0)
+    ctx.draw_rects(rects)
+    ctx.cmd_S()
+    with ctx.command_buffer() as buf:
+        for i in range(200):
+            buf.cmd_rg(i / 200, 0.2, 0.8)
+            buf.cmd_re(i * 2.5, 820, 2, 10)
+            buf.cmd_f()
+
+def draw_text(ctx, fid, page):
+    for i in range(30):
+        text = TEXTS[(i + page) % len(TEXTS)]
+        ctx.render_text(text, fid, 10, 30, 40 + i * 24)
+    ctx.render_text(' '.join(TEXTS * 10), fid, 6, 30, 20)
+
+def train(ofilename, fontfile):
+    opts = capypdf.Options()
+    props = capypdf.PageProperties()
+    props.set_pagebox(capypdf.PageBox.Media, 0, 0, PAGE_W, PAGE_H)
+    opts.set_default_page_properties(props)
+    with capypdf.Generator(ofilename, opts) as g:
+        fid = g.load_font(fontfile)
+        for page in range(NUM_PAGES):
+            with g.page_draw_context() as ctx:
+                draw_grid(ctx, page)
+                draw_batched(ctx)
+                draw_text(ctx, fid, page)
+
+if __name__ == '__main__':
+    if len(sys.argv) < 2:
+        sys.exit(f'{sys.argv[0]} <output pdf> [font file]')
+    fontfile = pathlib.Path(sys.argv[2]) if len(sys.argv) > 2 else default_font
+    train(sys.argv[1], fontfile)